@@ -0,0 +1,68 @@
+"""Bytes per node of the parsed tree, before and after Node got __slots__.
+
+Run from the root directory of the project with `python -m benchmarks.bench_node_memory [lines]`
+"""
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from pyfiletree.ftree import FTree, Node, Types
+
+
+class DictNode:
+    # layout of Node before __slots__: one __dict__ per node with eight attributes
+    def __init__(self, value, father_node=None, line=-1):
+        self.level = (len(value) - len(value.lstrip())) // 4
+        self.value = value.lstrip()
+        self.line = line + 1
+        self.children = []
+        self.father = father_node
+        self.type = Types.STATEMENT
+        self.DEBUG = False
+        self.TEST = False
+        self._stop_recursion = False
+
+
+def measure(build, lines):
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    kept = build(lines)
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del kept
+    return used / len(lines)
+
+
+def build_nodes(cls):
+    def build(lines):
+        root = cls('root')
+        for idx, line in enumerate(lines):
+            node = cls(line, father_node=root, line=idx)
+            root.children.append(node)
+        return root
+    return build
+
+
+def build_ftree(lines):
+    with tempfile.NamedTemporaryFile('w', suffix='.py', delete=False) as f:
+        f.writelines(lines)
+    try:
+        return FTree(f.name)
+    finally:
+        os.remove(f.name)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    lines = [f'{(idx % 4) * 4 * " "}x_{idx} = {idx}\n' for idx in range(count)]
+    values = sum(sys.getsizeof(line.lstrip()) for line in lines) / count
+
+    print(f'{count} nodes, values take {values:.0f} bytes per node')
+    print(f'dict Node   : {measure(build_nodes(DictNode), lines):.0f} bytes per node')
+    print(f'slotted Node: {measure(build_nodes(Node), lines):.0f} bytes per node')
+    print(f'FTree       : {measure(build_ftree, lines):.0f} bytes per node')
+
+
+if __name__ == '__main__':
+    main()
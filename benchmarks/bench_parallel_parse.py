@@ -0,0 +1,62 @@
+"""Parse time of a large file, serially and split at level 0 lines over worker processes.
+
+The workers only compute the levels and fathers, reading, stripping and creating the nodes stay in the calling
+process and take most of the serial time, so no speedup is expected: the parse line shows the part they can take.
+
+Run from the root directory of the project with `python -m benchmarks.bench_parallel_parse [lines] [workers ...]`
+"""
+import os
+import sys
+import tempfile
+import time
+
+from pyfiletree.ftree import FTree, parse_lines, read_lines
+
+
+class RecursiveFTree(FTree):
+    # serial parse with the original recursive builder
+    def _build_reader_tree(self):
+        with open(self.root.value, 'r') as f:
+            lines = f.readlines()
+        self._build_direct_children(self.root, lines)
+
+
+def make_lines(count):
+    lines = []
+    while len(lines) < count:
+        lines.append(f'class C{len(lines)}:\n')
+        for method in range(10):
+            lines.append(f'    def m{method}(self, a, b):\n')
+            lines.extend(f'        x_{idx} = a + b * {idx}\n' for idx in range(6))
+            lines.append('\n')
+    return lines
+
+
+def measure(build):
+    start = time.perf_counter()
+    build()
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    workers = [int(arg) for arg in sys.argv[2:]] or [2, 4, os.cpu_count()]
+    with tempfile.NamedTemporaryFile('w', suffix='.py', delete=False) as f:
+        f.writelines(make_lines(count))
+    try:
+        print(f'{count} lines, {os.cpu_count()} cpus')
+        with open(f.name, 'rb') as source:
+            data = source.read()
+        print(f'_build_direct_children: {measure(lambda: RecursiveFTree(f.name)):.2f}s')
+        serial = measure(lambda: FTree(f.name))
+        print(f'serial               : {serial:.2f}s')
+        print(f'parse (no nodes)     : {measure(lambda: parse_lines(read_lines(data))):.2f}s')
+        for worker_count in sorted(set(workers)):
+            elapsed = measure(lambda: FTree(f.name, workers=worker_count))
+            print(f'workers={worker_count:<13}: {elapsed:.2f}s ({serial / elapsed:.2f}x)')
+    finally:
+        os.remove(f.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""apply_transformer with a CPU heavy transformer, serially and over worker processes.
+
+Run from the root directory of the project with `python -m benchmarks.bench_parallel_transform [lines] [workers ...]`
+"""
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+from pyfiletree.ftree import FTree
+
+
+def checksum(value):
+    # stands for a CPU heavy transformer: appends a comment with a slow checksum of the line
+    if not value.strip():
+        return value
+    digest = value.encode()
+    for _ in range(200):
+        digest = hashlib.sha256(digest).digest()
+    return f'{value.rstrip()}  # {digest.hex()[:8]}\n'
+
+
+def measure(path, workers):
+    tree = FTree(path, transformer=[checksum])
+    start = time.perf_counter()
+    tree.apply_transformer(workers=workers)
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    workers = [int(arg) for arg in sys.argv[2:]] or [2, 4, os.cpu_count()]
+    with tempfile.NamedTemporaryFile('w', suffix='.py', delete=False) as f:
+        f.writelines(f'{(idx % 3) * 4 * " "}x_{idx} = {idx}\n' for idx in range(count))
+    try:
+        print(f'{count} lines, {os.cpu_count()} cpus')
+        serial = measure(f.name, None)
+        print(f'serial      : {serial:.2f}s')
+        for worker_count in sorted(set(workers)):
+            elapsed = measure(f.name, worker_count)
+            print(f'workers={worker_count:<4}: {elapsed:.2f}s ({serial / elapsed:.2f}x)')
+    finally:
+        os.remove(f.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Time to build a tree from a large file by parsing it, and by loading it from a ParseCache.
+
+Run from the root directory of the project with `python -m benchmarks.bench_parse_cache [lines]`
+"""
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_parallel_parse import make_lines
+from pyfiletree.cache import ParseCache
+from pyfiletree.ftree import FTree
+
+
+def measure(build):
+    gc.collect()  # trees are reference cycles, the previous one is freed here and not while measuring this one
+    start = time.perf_counter()
+    build()
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'big.py')
+    with open(path, 'w') as f:
+        f.writelines(make_lines(count))
+    os.utime(path, ns=(10 ** 18, 10 ** 18))  # old enough for the cache to trust its mtime
+    try:
+        cache = ParseCache(os.path.join(directory, 'cache'))
+        print(f'{count} lines')
+        print(f'parse        : {measure(lambda: FTree(path)):.2f}s')
+        print(f'cache miss   : {measure(lambda: FTree(path, cache=cache)):.2f}s')
+        print(f'cache hit    : {measure(lambda: FTree(path, cache=cache)):.2f}s')
+        os.utime(path, ns=(2 * 10 ** 18, 2 * 10 ** 18))
+        print(f'hit, touched : {measure(lambda: FTree(path, cache=cache)):.2f}s')
+        print(f'entry size   : {cache.cache_info().currsize / os.path.getsize(path):.2f}x the file')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Per line cost of running a transformer: the function list loop against a compiled Pipeline.
+
+Run from the root directory of the project with `python -m benchmarks.bench_pipeline [lines]`
+"""
+import sys
+import time
+
+from pyfiletree.ftree import run_transformer
+from pyfiletree.transformers import Pipeline, pure
+
+
+def measure(run, values):
+    start = time.perf_counter()
+    for value in values:
+        run(value)
+    return (time.perf_counter() - start) / len(values) * 1e9
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    values = [f'x_{idx} = {idx}\n' for idx in range(count)]
+    functions = [
+        lambda x: x.replace('x_', 'y_'),
+        lambda x: None if 'print' in x else x,
+        lambda x: x.rstrip() + '\n',
+        lambda x: x.upper(),
+    ]
+    f0, f1, f2, f3 = functions
+    direct = measure(lambda value: f3(f2(f1(f0(value)))), values)  # the calls alone, no checks
+    loop = measure(lambda value: run_transformer(functions, value), values)
+    fused = measure(Pipeline(functions).run, values)
+    fused_pure = measure(Pipeline([pure(functions[0]), functions[1], pure(functions[2]), pure(functions[3])]).run,
+                         values)
+    print(f'{count} lines, {len(functions)} functions, ns per line (overhead over calling the functions)')
+    print(f'functions only      : {direct:.0f}')
+    for name, elapsed in (('run_transformer loop', loop), ('Pipeline', fused), ('Pipeline with pure', fused_pure)):
+        print(f'{name:<20}: {elapsed:.0f} ({elapsed - direct:.0f})')
+
+
+if __name__ == '__main__':
+    main()
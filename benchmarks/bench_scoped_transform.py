@@ -0,0 +1,40 @@
+"""Repeated scoped transforms (types, lines) against transforming the whole tree.
+
+Run from the root directory of the project with `python -m benchmarks.bench_scoped_transform [lines] [calls]`
+"""
+import gc
+import sys
+import time
+
+from pyfiletree.ftree import FTree, Types
+
+
+def make_source(count):
+    block = 'class C{0}:\n    def f(self):\n        x = {0}\n        return x\n\n'
+    return ''.join(block.format(idx) for idx in range(count // 5))
+
+
+def measure(tree, calls, **scope):
+    gc.collect()
+    start = time.perf_counter()
+    for _ in range(calls):
+        tree.apply_transformer(**scope)
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    calls = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    source = make_source(count)
+    print(f'{count} lines, seconds per call (mean of {calls})')
+    for computed_lines in (False, True):
+        tree = FTree.from_string(source, transformer=[lambda x: x.replace('x', 'y')], computed_lines=computed_lines)
+        whole = measure(tree, calls)
+        types = measure(tree, calls, types={Types.CLASS})
+        lines = measure(tree, calls, lines=range(1000, 1010))
+        print(f'computed_lines={computed_lines}: whole tree {whole:.4f}, types={{CLASS}} {types:.4f}, '
+              f'lines=range(1000, 1010) {lines:.6f}')
+
+
+if __name__ == '__main__':
+    main()
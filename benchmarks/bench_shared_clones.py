@@ -0,0 +1,52 @@
+"""Memory and time of fanning one module out into many variants with a few edits each, with clones copying every
+node and with clones sharing the lines they don't change.
+
+Run from the root directory of the project with `python -m benchmarks.bench_shared_clones [lines] [variants]`
+"""
+import gc
+import sys
+import time
+import tracemalloc
+
+from benchmarks.bench_parallel_parse import make_lines
+from pyfiletree.ftree import FTree
+
+
+def rename_tenant(value):
+    return value.replace('x_3 =', 'tenant_x =') if value.startswith('x_3 = a + b * 3') else value
+
+
+def make_variants(base, count, share):
+    variants = []
+    for idx in range(count):
+        variant = base.clone(share=share)
+        variant.get_node_by_line(1 + idx % base.root.size).value = f'TENANT = {idx}\n'
+        variant.transformer = [rename_tenant]
+        variant.apply_transformer(lines=range(1, 200))
+        variants.append(variant)
+    return variants
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    variant_count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    print(f'{count} lines, {variant_count} variants')
+    for share in (False, True):
+        base = FTree.from_string(''.join(make_lines(count)), computed_lines=True)
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        variants = make_variants(base, variant_count, share)
+        elapsed = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        start = time.perf_counter()
+        for variant in variants:
+            variant.to_string()
+        rendering = time.perf_counter() - start
+        print(f'share={share!s:<5}: {memory / 2 ** 20:8.1f} MiB, {elapsed:.2f}s to make, {rendering:.2f}s to render')
+        del variants, base
+
+
+if __name__ == '__main__':
+    main()
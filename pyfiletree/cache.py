@@ -0,0 +1,182 @@
+import hashlib
+import marshal
+import os
+import tempfile
+import time
+from array import array
+from collections import OrderedDict, namedtuple
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+# bumped when the entries change, entries of other versions are misses
+FORMAT = 1
+SUFFIX = '.ftree'
+# files changed less than this before being parsed could change again without a new mtime, their content is checked
+RACY_NS = 2 * 10 ** 9
+
+
+class Cache:
+    # Parsed forms of files (stripped values, levels and fathers of their lines) with the size, mtime and hash of the
+    # content they were parsed from. A file whose size and mtime match its entry is loaded without being read,
+    # otherwise its content is hashed and the entry still hits if the content is the same (i.e. touched by a checkout).
+    # Subclasses keep the entries, see ParseCache and TreeCache.
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, path, parse):
+        # values, levels and fathers of the file at path, parse(content) is called on a miss
+        path = os.path.abspath(path)
+        entry = self._load(path)
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())  # before reading, a change made while reading gets a newer mtime
+            if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+                self.hits += 1
+                self._touch(path)
+                return entry[3:]
+            content = f.read()
+        digest = hashlib.blake2b(content, digest_size=16).digest()
+        if entry is not None and entry[2] == digest:
+            self.hits += 1
+            parsed = entry[3:]
+        else:
+            self.misses += 1
+            parsed = tuple(parse(content))
+        mtime = stat.st_mtime_ns if time.time_ns() - stat.st_mtime_ns >= RACY_NS else None
+        self._store(path, (stat.st_size, mtime, digest) + parsed)
+        return parsed
+
+    def _load(self, path):
+        # (size, mtime, digest, values, levels, fathers) or None
+        raise NotImplementedError
+
+    def _store(self, path, entry):
+        raise NotImplementedError
+
+    def _touch(self, path):
+        # entry of path was used
+        raise NotImplementedError
+
+
+class TreeCache(Cache):
+    # Parsed files kept in memory, for files read many times by a process, i.e. snippets appended by path.
+    # Holds the maxsize most recently used files, the trees are built from the cached lines without reading the files.
+    def __init__(self, maxsize=128):
+        super().__init__(maxsize)
+        self._entries = OrderedDict()
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+    def clear(self):
+        self._entries.clear()
+
+    def _load(self, path):
+        return self._entries.get(path)
+
+    def _store(self, path, entry):
+        self._entries[path] = entry
+        self._entries.move_to_end(path)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _touch(self, path):
+        self._entries.move_to_end(path)
+
+
+class ParseCache(Cache):
+    # Directory of parsed files, shared by processes and runs, an entry holds the marshaled lines of a file.
+    # The least recently used entries are removed when the entries take more than maxsize bytes.
+    def __init__(self, directory, maxsize=64 << 20):
+        super().__init__(maxsize)
+        self.directory = directory
+        self._currsize = None  # bytes of the entries, counted on the first store
+        os.makedirs(directory, exist_ok=True)
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, self._count_size())
+
+    def clear(self):
+        for entry in self._entries():
+            self._remove(entry.path)
+        self._currsize = 0
+
+    def _entry_path(self, path):
+        return os.path.join(self.directory, hashlib.blake2b(path.encode(), digest_size=16).hexdigest() + SUFFIX)
+
+    def _touch(self, path):
+        try:
+            os.utime(self._entry_path(path))  # recently used
+        except OSError:
+            pass
+
+    def _load(self, path):
+        try:
+            with open(self._entry_path(path), 'rb') as f:
+                data = marshal.load(f)
+            version, entry_for, size, mtime, digest, values, levels, fathers = data
+        except (OSError, EOFError, ValueError, TypeError):  # missing, partly written or from another version
+            return None
+        if version != FORMAT or entry_for != path:
+            return None
+        return size, mtime, digest, values, array_from(levels), array_from(fathers)
+
+    def _store(self, path, entry):
+        entry_path = self._entry_path(path)
+        size, mtime, digest, values, levels, fathers = entry
+        data = marshal.dumps((FORMAT, path, size, mtime, digest, list(values),
+                              array('i', levels).tobytes(), array('i', fathers).tobytes()))
+        try:
+            old_size = os.stat(entry_path).st_size
+        except OSError:
+            old_size = 0
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, entry_path)  # other processes never load a partly written entry
+        except BaseException:
+            self._remove(temp_path)
+            raise
+        if self._currsize is None:
+            self._currsize = self._count_size()
+        else:
+            self._currsize += len(data) - old_size
+        if self._currsize > self.maxsize:
+            self._evict()
+
+    def _evict(self):
+        # other processes may have added entries, so the sizes are read again
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime_ns)
+        self._currsize = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self._currsize <= self.maxsize:
+                break
+            self._currsize -= entry.stat().st_size
+            self._remove(entry.path)
+
+    def _entries(self):
+        with os.scandir(self.directory) as entries:
+            return [entry for entry in entries if entry.name.endswith(SUFFIX)]
+
+    def _count_size(self):
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def array_from(data):
+    values = array('i')
+    values.frombytes(data)
+    return values
@@ -0,0 +1,198 @@
+from array import array
+from itertools import accumulate
+
+from .ftree import FTree, Level, Node, get_runner, merge_transformer, parse_lines
+
+
+class NodeView:
+    # lightweight handle on a line of a ColumnarFTree, only valid until the tree is rebuilt by apply_transformer
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index  # -1 for root
+
+    def __eq__(self, other):
+        if isinstance(other, NodeView):
+            return self.tree is other.tree and self.index == other.index
+        return NotImplemented
+
+    def __str__(self):
+        return self.render(self.tree.DEBUG, self.tree.TEST)
+
+    @property
+    def value(self):
+        return self.tree.get_value(self.index)
+
+    @value.setter
+    def value(self, value):
+        self.tree.set_value(self.index, value)
+
+    @property
+    def level(self):
+        return self.tree.levels[self.index] if self.index >= 0 else Level.ROOT
+
+    @property
+    def line(self):
+        return self.index + 1
+
+    @property
+    def size(self):
+        return self.tree.sizes[self.index] if self.index >= 0 else len(self.tree.levels)
+
+    @property
+    def father(self):
+        if self.index < 0:
+            return None
+        return NodeView(self.tree, self.tree.fathers[self.index])
+
+    @property
+    def children(self):
+        return [NodeView(self.tree, index) for index in self.tree.iter_children(self.index)]
+
+    type = property(Node.compute_type)
+
+    def render(self, debug=False, test=False):
+        if self.index < 0:
+            return self.value
+        return self.tree.render(self.index, debug, test)
+
+
+class ColumnarFTree:
+    # FTree stored as parallel arrays in pre-order instead of Node objects, the line of a node is its index + 1.
+    # The first child of a node is the next index, its next sibling is index + size + 1.
+    # Values are offsets into one string holding all the stripped lines.
+    def __init__(self, file_path, transformer=None, debug=False, test=False):
+        self.file_path = file_path
+        self.transformer = transformer
+        self.DEBUG = debug
+        self.TEST = test
+        self.levels = array('i')
+        self.fathers = array('i')
+        self.sizes = array('i')
+        self.starts = array('q')
+        self.ends = array('q')
+        self._text = ''
+        self._changed_values = {}  # index -> value set since the text was built
+
+        self._build_reader_tree()
+
+    def __eq__(self, other):
+        if isinstance(other, ColumnarFTree):
+            return self.levels == other.levels and all(
+                self.get_value(idx) == other.get_value(idx) for idx in range(len(self.levels)))
+        if isinstance(other, FTree):
+            count = 0
+            for idx, node in enumerate(other.iter_nodes()):
+                if idx >= len(self.levels) or node.level != self.levels[idx] or node.value != self.get_value(idx):
+                    return False
+                count += 1
+            return count == len(self.levels)
+        return NotImplemented
+
+    def _build_reader_tree(self):
+        with open(self.file_path, 'r') as f:
+            lines = f.readlines()
+        self._set_columns(*parse_lines(lines))
+
+    def _set_columns(self, values, levels, fathers):
+        self._text = ''.join(values)
+        self._changed_values = {}
+        self.ends = array('q', accumulate(map(len, values)))
+        self.starts = array('q', [0])
+        self.starts.extend(self.ends[:-1])
+        self.levels = array('i', levels)
+        self.fathers = array('i', fathers)
+        self.sizes = array('i', bytes(4 * len(levels)))
+        for idx in range(len(fathers) - 1, -1, -1):
+            if fathers[idx] >= 0:
+                self.sizes[fathers[idx]] += 1 + self.sizes[idx]
+
+    @property
+    def root(self):
+        return NodeView(self, -1)
+
+    def get_value(self, index):
+        if index < 0:
+            return self.file_path
+        value = self._changed_values.get(index)
+        if value is None:
+            return self._text[self.starts[index]:self.ends[index]]
+        return value
+
+    def set_value(self, index, value):
+        self._changed_values[index] = value
+
+    def iter_children(self, index):
+        child = index + 1
+        last = index + self.sizes[index] if index >= 0 else len(self.levels) - 1
+        while child <= last:
+            yield child
+            child += self.sizes[child] + 1
+
+    def render(self, index, debug=False, test=False, empty=''):
+        value = self.get_value(index) or empty
+        if debug:
+            return f'{self.levels[index] * 4 * " "}{value[:-1]} ' \
+                   f'--> lvl:{self.levels[index]} : line{index + 1} : ' \
+                   f'father:{self.get_value(self.fathers[index]).strip()}\n'
+        if test:
+            return f'{value}'
+        return f'{self.levels[index] * 4 * " "}{value}'
+
+    def set_transformer(self, new_transformer):
+        self.transformer = merge_transformer(self.transformer, new_transformer)
+
+    def get_node_by_line(self, line):
+        if not 0 <= line <= len(self.levels):
+            raise Exception(f'No node at line {line}')
+        return NodeView(self, line - 1)
+
+    def write_to(self, path, mode='a+', apply_transformer=False):
+        if apply_transformer:
+            self.apply_transformer()
+        with open(path, mode=mode) as f:
+            for idx in range(len(self.levels)):
+                f.write(self.render(idx, self.DEBUG, self.TEST, empty='\n'))
+
+    def print_tree(self):
+        print(self.file_path, end='')
+        for idx in range(len(self.levels)):
+            end = '\n' if self.DEBUG or not self.get_value(idx) else ''
+            print(self.render(idx, self.DEBUG, self.TEST), end=end)
+
+    def apply_transformer(self):
+        # deleted lines are dropped in one pass over the columns, children of lines deleted with keep_children are
+        # moved to the closest kept ancestor and get their levels recomputed from it, same as Node.delete
+        if not self.transformer:
+            raise Exception("Transformer empty")
+        run = get_runner(self.transformer)
+        values, levels, fathers = [], [], []
+        count = len(self.levels)
+        new_index = array('i', bytes(4 * count))  # new index of kept lines, new father of lines deleted with children
+        dropped = bytearray(count)
+        moved = bytearray(count)  # line is in the subtree of a line deleted with keep_children
+        for idx in range(count):
+            father = self.fathers[idx]
+            if father >= 0 and dropped[father]:
+                dropped[idx] = 1
+                continue
+            value, keep = run(self.get_value(idx))
+            new_father = new_index[father] if father >= 0 else -1
+            if father >= 0 and moved[father]:
+                moved[idx] = 1
+            if value is None:
+                if keep:
+                    new_index[idx] = new_father
+                    moved[idx] = 1
+                else:
+                    dropped[idx] = 1
+                continue
+            new_index[idx] = len(values)
+            values.append(value)
+            if moved[idx]:
+                levels.append(levels[new_father] + 1 if new_father >= 0 else 0)
+            else:
+                levels.append(self.levels[idx])
+            fathers.append(new_father)
+        self._set_columns(values, levels, fathers)
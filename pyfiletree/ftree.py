@@ -1,4 +1,26 @@
+import copy
+import heapq
+import io
+import mmap
+import os
+import pickle
+import re
+import shutil
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
+from functools import partial
+from itertools import accumulate, count
+from operator import add, attrgetter
+
+from .transformers import Memoized, Pipeline
+
+try:
+    import numpy
+except ImportError:  # optional, lines are scanned with MAPPED_LINE instead
+    numpy = None
 
 
 class Level:
@@ -13,40 +35,195 @@ class Types(Enum):
     EMPTY_LINE = 3
 
 
+# indentation, value and line ending of a line in a bytes buffer
+MAPPED_LINE = re.compile(rb'([ \t\x0b\x0c\r]*)([^\n]*)(\n?)')
+# start of a line on level 0 which isn't empty
+TOP_LEVEL_LINE = re.compile(rb'^[ \t\x0b\x0c\r]{0,3}[^ \t\x0b\x0c\r\n]', re.MULTILINE)
+# a line which isn't rendered as it is written: indentation other than a multiple of 4 spaces, or an empty line whose
+# indentation follows its father
+NON_CANONICAL_LINE = re.compile(rb'^(?:(?: {4})*(?: {1,3}(?:[^ ]|\Z)|[\t\x0b\x0c\r\n])|(?: {4})+\Z)', re.MULTILINE)
+# the indentation characters of MAPPED_LINE
+INDENT_BYTES = b' \t\x0b\x0c\r'
+# lines rendered before each write of write_to
+WRITE_CHUNK = 4096
+# smaller spans are scanned with MAPPED_LINE even when numpy is installed, the arrays cost more than they save
+NUMPY_MIN_BYTES = 1 << 12
+
+
+# Returns the index of every line's father, -1 for the node the lines are parsed under.
+# Single pass equivalent of FTree._build_direct_children: the recursion frames are kept on an explicit stack of
+# open parents, so deeply nested files don't hit the recursion limit. Levels of empty lines are changed in place.
+def compute_fathers(levels, blanks, father_level=Level.ROOT):
+    fathers = []
+    stack = [-1]
+    stack_levels = [father_level]
+    for idx, level in enumerate(levels):
+        father_lvl = stack_levels[-1]
+        if idx == 0:  # first line is added as is
+            pass
+        elif blanks[idx]:  # empty lines belong to the innermost open parent
+            levels[idx] = father_lvl + 1
+        elif level > father_lvl + 1:
+            if level >= levels[idx - 1] + 1:  # open the previous line as parent
+                stack.append(idx - 1)
+                stack_levels.append(levels[idx - 1])
+        elif level < father_lvl + 1:  # close parents until one can hold this line
+            while len(stack) > 1 and level < stack_levels[-1] + 1:
+                stack.pop()
+                stack_levels.pop()
+        fathers.append(stack[-1])
+    return fathers
+
+
+# Levels and fathers of the lines in the bytes path[start:end], fathers are indexes in the chunk.
+# Runs in the worker processes of FTree(workers=N), the chunk has to start on a level 0 line.
+def parse_chunk(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    _, levels, fathers = parse_lines(read_lines(data))
+    return array('i', levels), array('i', fathers)
+
+
+# Stripped values, levels and fathers of lines read from a file
+def parse_lines(lines, father_level=Level.ROOT):
+    values = [line.lstrip() for line in lines]
+    levels = [(len(line) - len(value)) // 4 for line, value in zip(lines, values)]
+    fathers = compute_fathers(levels, [not value for value in values], father_level)
+    return values, levels, fathers
+
+
+def read_lines(data):
+    return io.TextIOWrapper(io.BytesIO(data)).readlines()  # same decoding and newlines as open(path, 'r')
+
+
+# Byte offsets splitting the buffer in about equal chunks, every chunk but the first starts on a level 0 line
+def split_top_level(buffer, chunks):
+    starts = [match.start() for match in TOP_LEVEL_LINE.finditer(buffer)]
+    bounds = [0]
+    for idx in range(1, chunks):
+        pos = bisect_left(starts, len(buffer) * idx // chunks)
+        if pos < len(starts) and starts[pos] > bounds[-1]:
+            bounds.append(starts[pos])
+    bounds.append(len(buffer))
+    return bounds
+
+
+# Applies the functions of a transformer in order. Returns the new value and None, or None and keep_children when the
+# value is to be deleted.
+def run_transformer(transformer, value):
+    for func in transformer:
+        val = func(value)
+        if isinstance(val, tuple) or val is None:
+            val = tuple([val]) if not isinstance(val, tuple) else val
+            if val[0] is None:
+                return None, val[1] if len(val) == 2 else True
+        else:
+            value = val
+    return value, None
+
+
+# Adds the functions of new_transformer to transformer, returns the transformer to keep. It stays a Memoized or a
+# Pipeline when either of them is one, so the lines keep being cached or compiled.
+def merge_transformer(transformer, new_transformer):
+    if not transformer:
+        return new_transformer
+    if isinstance(new_transformer, Memoized) and not isinstance(transformer, Memoized):
+        transformer = Memoized(transformer, new_transformer.maxsize)
+    elif isinstance(new_transformer, Pipeline) and not isinstance(transformer, Pipeline):
+        transformer = Pipeline(transformer)
+    transformer.extend(new_transformer)
+    return transformer
+
+
+# Returns the function applying a transformer to one value, compiled transformers (see transformers.Pipeline) bring
+# their own
+def get_runner(transformer):
+    run = getattr(transformer, 'run', None)
+    if run is not None:
+        return run
+    return partial(run_transformer, transformer)
+
+
+_worker_runner = None
+
+
+def init_transform_worker(transformer):
+    global _worker_runner
+    _worker_runner = get_runner(transformer)
+
+
+# Runs in the worker processes of FTree.apply_transformer(workers=N), None stands for an unchanged value
+def transform_batch(values):
+    results = []
+    for value in values:
+        result = _worker_runner(value)
+        results.append(None if result[0] is value else result)
+    return results
+
+
 class Node:
-    def __init__(self, value, father_node=None, line=-1, level=Level.UNASSIGNED, debug=False, test=False):
+    __slots__ = ('level', 'value', '_line', 'children', 'size', '_offsets', 'father')
+
+    def __init__(self, value, father_node=None, line=-1, level=Level.UNASSIGNED):
         self.level = self.compute_level(value, level)
         self.value = value.lstrip()  # strip indentation
-        self.line = line + 1
+        self._line = None if line is None else line + 1  # None when the line is computed from the tree
         self.children = []
+        self.size = 0  # number of descendants
+        self._offsets = None  # cached (position of each child, lines before each child)
         self.father = father_node
-        self.type = self.compute_type()
-        self.DEBUG = debug
-        self.TEST = test
-        self._stop_recursion = False
 
     def __str__(self):
-        if self.DEBUG:
-            return f'{self.level * 4 * " "}{self.value[:-1]} ' \
+        # rendering flags belong to the tree owning the node
+        tree = getattr(self.get_root(), 'tree', None)
+        if tree is None:
+            return self.render()
+        return self.render(tree.DEBUG, tree.TEST)
+
+    def render(self, debug=False, test=False, empty=''):
+        value = self.value or empty
+        if debug:
+            return f'{self.level * 4 * " "}{value[:-1]} ' \
                    f'--> lvl:{self.level} : line{self.line} : father:{self.father.value.strip()}\n'
-        if self.TEST:
-            return f'{self.value}'
-        return f'{self.level * 4 * " "}{self.value}'
+        if test:
+            return f'{value}'
+        return f'{self.level * 4 * " "}{value}'
 
     def __eq__(self, other):
         if isinstance(other, Node):
             return Node.are_equal(self, other)
         return NotImplemented
 
+    @property
+    def line(self):
+        if self._line is not None:
+            return self._line
+        return self.compute_line()
+
+    @line.setter
+    def line(self, line):
+        self._line = line
+
+    @property
+    def type(self):
+        return self.compute_type()
+
     def delete(self, keep_children=True):
-        index = self.father.children.index(self)
+        father = self.father
+        if father is None:
+            raise Exception('Node has no father to be deleted from')
+        index = father.get_position(self)
         if keep_children:
-            self.father.children[index:index+1] = self.children
+            father.children[index:index+1] = self.children
             for child in self.children:
-                child.father = self.father
-                child.update_level(self.father.level)
+                child.father = father
+                child.update_level(father.level)
+            father.update_size(-1)
         else:
-            self.father.children.pop(index)
+            father.children.pop(index)
+            father.update_size(-1 - self.size)
+        self.father = None
 
     @staticmethod
     def are_equal(node1, node2):
@@ -79,86 +256,567 @@ class Node:
 
     def add_child(self, node):
         self.children.append(node)
+        node.father = self
+        self.update_size(1 + node.size)
 
-    def add_children(self, children, node_to_be_replaced=None, line=-1, debug=False):
+    def add_children(self, children, node_to_be_replaced=None, line=-1):
+        real_length = Node.get_real_length(children)
         if line == -1:
-            line_offset = Node.get_real_length(self.children)
+            line_offset = self.size
             for child in children:
-                child.update_line(line_offset, debug=debug)
+                child.update_line(line_offset)
                 child.father = self
             self.children.extend(children)
         else:
-            idx_to_be_replaced = self.children.index(node_to_be_replaced)
+            idx_to_be_replaced = self.get_position(node_to_be_replaced)
 
             # update lines and lvls in children to be appended
-            real_lengths = [1 + Node.get_real_length(child.children) for child in children]
-            for idx, child in enumerate(children):
-                child.update_line(line + sum(real_lengths[:idx]), new_line=0, debug=debug)
+            for child in children:
+                child.update_line(line, new_line=0)
                 child.update_level(self.level)
                 child.father = self
+                line += 1 + child.size
 
             self.children[idx_to_be_replaced:idx_to_be_replaced] = children
+        self.update_size(real_length)
 
-    def print_tree(self):
-        end = '\n' if self.DEBUG or not self.value else ''
-        print(self, end=end)
-        for child in self.children:
-            child.print_tree()
+    def print_tree(self, debug=False, test=False):
+        for node in self.iter_subtree():
+            end = '\n' if debug or not node.value else ''
+            print(node.render(debug, test), end=end)
+
+    def iter_subtree(self):
+        # this node and its descendants in pre-order, without recursion
+        yield self
+        stack = [iter(self.children)]
+        while stack:
+            node = next(stack[-1], None)
+            if node is None:
+                stack.pop()
+                continue
+            yield node
+            if node.children:
+                stack.append(iter(node.children))
+
+    def clone(self):
+        # copy of this node and the lines under it, without a father. Made without recursion and without parsing the
+        # values again, unparsed lazy lines stay unparsed.
+        node = self._copy(None)
+        clone_children(self, node)
+        return node
+
+    def _copy(self, father):
+        # this node without its children, __init__ is skipped since level and value are already computed
+        node = object.__new__(type(self))
+        node.level = self.level
+        node.value = self.value
+        node._line = self._line
+        node.children = []
+        node.size = self.size
+        node._offsets = None
+        node.father = father
+        return node
 
     def get_node_list(self, lst):
-        if self.level != Level.ROOT:
-            lst.append(self)
-        for child in self.children:
-            child.get_node_list(lst)
-
-    def update_line(self, offset, new_line=None, debug=False):
-        self.line = self.line if new_line is None else new_line
-        self.line += offset
-        self.DEBUG = debug
+        lst.extend(node for node in self.iter_subtree() if node.level != Level.ROOT)
 
-        real_lengths = [Node.get_real_length(child.children) if new_line is not None else 0 for child in self.children]
-        for idx, child in enumerate(self.children):
-            offset = offset if new_line is None else offset + 1
-            child.update_line(offset + sum(real_lengths[:idx]), new_line, debug)
+    def update_line(self, offset, new_line=None):
+        for idx, node in enumerate(self.iter_subtree()):
+            if node._line is None:  # computed lines follow the tree by themselves
+                return
+            if new_line is None:
+                node.line += offset
+            else:  # children are offsetted by their position in the subtree
+                node.line = new_line + offset + idx
 
     def update_level(self, fathers_lvl):
-        self.level = fathers_lvl + 1
-        for child in self.children:
-            child.update_level(self.level)
+        stack = [(self, fathers_lvl)]
+        while stack:
+            node, fathers_lvl = stack.pop()
+            node.level = fathers_lvl + 1
+            if type(node) is SharedNode and node._source is not None and levels_follow(node._source):
+                continue  # lines still shared follow the node's level
+            stack.extend((child, node.level) for child in node.children)
 
     def update_lines_globally(self, line_tresh, offset):
-        if self.line >= line_tresh:
-            self.line += offset
-        for child in self.children:
-            child.update_lines_globally(line_tresh, offset)
+        for node in self.iter_subtree():
+            if node.line >= line_tresh:
+                node.line += offset
+
+    def update_size(self, offset):
+        node = self
+        while node is not None:
+            node.size += offset
+            node._offsets = None
+            node = node.father
+
+    def get_offsets(self):
+        # rebuilt in O(children) after any change under this node, with C loops only
+        if self._offsets is None:
+            children = self.children
+            positions = dict(zip(map(id, children), count()))
+            offsets = [0]
+            offsets.extend(map(add, count(1), accumulate(map(attrgetter('size'), children))))
+            self._offsets = positions, offsets
+        return self._offsets
+
+    def get_position(self, child):
+        # by identity, list.index would match the first child equal to it
+        return self.get_offsets()[0][id(child)]
+
+    def compute_line(self):
+        # lines are positions in the tree: 1 + father's line + lines taken by the previous siblings
+        line = 0
+        node = self
+        while node._line is None:
+            father = node.father
+            if father is None:
+                return line
+            positions, offsets = father.get_offsets()
+            line += 1 + offsets[positions[id(node)]]
+            node = father
+        return line + node._line
+
+    def get_root(self):
+        node = self
+        while node.father is not None:
+            node = node.father
+        return node
+
+    def get_descendant_by_line(self, line):
+        # line is relative to this node, descends through the children's line offsets
+        node = self
+        while line:
+            if line < 0 or line > node.size:
+                return None
+            _, offsets = node.get_offsets()
+            idx = bisect_right(offsets, line - 1) - 1
+            line -= 1 + offsets[idx]
+            node = node.children[idx]
+        return node
 
     @staticmethod
     def get_real_length(children):
-        offset = len(children)
-        for child in children:
-            offset += Node.get_real_length(child.children)
-        return offset
+        return len(children) + sum(child.size for child in children)
+
+
+_node_value = Node.value
+
+
+class MappedNode(Node):
+    # value is kept as the span of the line in the memory mapped source file and decoded each time it's read,
+    # until a new value is set
+    __slots__ = ('_buffer', '_start', '_end', '_origin')
+
+    def __init__(self, buffer, start, end, father_node=None, line=-1, level=Level.UNASSIGNED, origin=None):
+        super().__init__('', father_node, line, level)
+        self._buffer = buffer
+        self._start = start
+        self._end = end
+        self._origin = origin  # start of the line in the source, when it was read already rendered as written
+
+    @property
+    def value(self):
+        if self._buffer is None:
+            return _node_value.__get__(self)
+        return self._buffer[self._start:self._end].decode()
+
+    @value.setter
+    def value(self, value):
+        _node_value.__set__(self, value)
+        self._buffer = None
+
+    def _copy(self, father):
+        # the copy reads the same source, the slots are set directly since value and children are properties
+        node = object.__new__(type(self))
+        node.level = self.level
+        _node_value.__set__(node, _node_value.__get__(self))
+        node._line = self._line
+        _node_children.__set__(node, [])
+        node.size = self.size
+        node._offsets = None
+        node.father = father
+        node._buffer = self._buffer
+        node._start = self._start
+        node._end = self._end
+        node._origin = self._origin
+        return node
+
+    def get_raw_value(self):
+        # bytes of the unchanged value straight from the source, None once the value was set
+        if self._buffer is None:
+            return None
+        return self._buffer[self._start:self._end]
+
+    def get_origin(self, buffer):
+        # span of the line in buffer while the node still renders exactly as it is there, None once its value or level
+        # changed (dirty)
+        if self._buffer is not buffer or self._origin is None:
+            return None
+        ending = len(line_ending(buffer, self._end)) if self._start == self._end else 0
+        if self._start - self._origin - ending != self.level * 4:
+            return None
+        return self._origin, self._end
+
+    def detach_value(self):
+        # the value stops being read from the source, which can then change: the bytes of the line are copied, along
+        # with the line ending of an empty value
+        if self._buffer is not None:
+            start = max(self._start - 2, 0)
+            self._buffer = self._buffer[start:self._end]
+            self._start -= start
+            self._end -= start
+            self._origin = None
+
+
+_node_children = Node.children
+
+
+class LazyNode(MappedNode):
+    # the lines under this node are kept as a span of the source and parsed the first time the children are accessed
+    __slots__ = ('_body',)
+
+    def __init__(self, buffer, start, end, body_end, body_lines, father_node=None, level=Level.UNASSIGNED,
+                 origin=None):
+        super().__init__(buffer, start, end, father_node, None, level, origin)
+        self._body = (buffer, end, body_end) if body_lines else None
+        self.size = body_lines
+
+    @property
+    def children(self):
+        if self._body is not None:
+            buffer, start, end = self._body
+            self._body = None
+            self.update_size(-self.size)
+            build_mapped_children(self, buffer, start, end, first_line=None)
+        return _node_children.__get__(self)
+
+    @children.setter
+    def children(self, children):
+        _node_children.__set__(self, children)
+
+    def _copy(self, father):
+        node = super()._copy(father)
+        node._body = self._body
+        return node
+
+    def get_raw_body(self):
+        # bytes of the lines under this node straight from the source, None once they were parsed
+        if self._body is None:
+            return None
+        buffer, start, end = self._body
+        return buffer[start:end]
+
+    def get_rendered_body(self):
+        # bytes of the lines under this node as they are rendered once parsed, without parsing them. None once they
+        # were parsed
+        if self._body is None:
+            return None
+        buffer, start, end = self._body
+        if NON_CANONICAL_LINE.search(buffer, start, end) is None:
+            return buffer[start:end]
+        return render_mapped_lines(buffer, start, end, self.level)
+
+    def get_body_origin(self, buffer):
+        # span of the lines under this node in buffer while they are rendered as they are there, None once they were
+        # parsed
+        if self._body is None or self._body[0] is not buffer:
+            return None
+        _, start, end = self._body
+        if NON_CANONICAL_LINE.search(buffer, start, end) is not None:
+            return None
+        return start, end
+
+    def is_parsed(self):
+        return self._body is None
+
+
+class SharedNode(Node):
+    # Copy of a node whose descendants are shared with other trees (copy-on-write): the lines under it are read from
+    # the source node until the children are accessed the first time, then the children become SharedNodes of the
+    # source's children. Reaching a line to change it only copies the nodes on its path and their siblings.
+    # Sources are never changed, the lines under them are offset by the difference between the levels.
+    __slots__ = ('_source',)
+
+    @property
+    def children(self):
+        if self._source is not None:
+            source = self._source
+            self._source = None
+            delta = self.level - source.level
+            _node_children.__set__(self, [share_node(child, self, delta) for child in source.children])
+        return _node_children.__get__(self)
+
+    @children.setter
+    def children(self, children):
+        self._source = None
+        _node_children.__set__(self, children)
+
+    def _copy(self, father):
+        node = super()._copy(father)
+        node._source = self._source
+        return node
+
+    def is_shared(self):
+        return self._source is not None
+
+
+# SharedNode of node under father, levels of node and the lines under it are offset by delta
+def share_node(node, father, delta=0):
+    shared = object.__new__(SharedNode)
+    shared.level = node.level + delta
+    shared.value = node.value
+    shared._line = None  # lines under a source can't be stored
+    _node_children.__set__(shared, [])
+    shared.size = node.size
+    shared._offsets = None
+    shared.father = father
+    if not node.size:
+        shared._source = None
+    elif type(node) is SharedNode and node._source is not None:
+        shared._source = node._source
+    else:
+        shared._source = node
+    return shared
+
+
+# Whether every line under node is one level deeper than its father, when they are the level of node can change
+# without changing theirs
+def levels_follow(node):
+    stack = [(iter(node.children), node.level + 1)]
+    while stack:
+        children, level = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            continue
+        if child.level != level:
+            return False
+        if type(child) is SharedNode and child._source is not None:  # its lines follow it when they follow its source
+            stack.append((iter(child._source.children), child._source.level + 1))
+        elif child.children:
+            stack.append((iter(child.children), level + 1))
+    return True
+
+
+# Nodes under father in pre-order with the offset of their levels, the lines under SharedNodes are read from their
+# source without copying them, so the nodes must not be changed
+def iter_shared(father):
+    stack = [(iter(father.children), 0)]
+    while stack:
+        children, delta = stack[-1]
+        node = next(children, None)
+        if node is None:
+            stack.pop()
+            continue
+        yield node, delta
+        if type(node) is SharedNode and node._source is not None:
+            source = node._source
+            stack.append((iter(source.children), delta + node.level - source.level))
+        elif node.children:
+            stack.append((iter(node.children), delta))
+
+
+# Identity and version of a file, to know if it's still the one a tree was read from
+def get_file_stat(stat):
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+# Line ending of the line ending at end in buffer, for empty values which don't hold it
+def line_ending(buffer, end):
+    return b'\r\n' if buffer[end - 2:end] == b'\r\n' else b'\n'
+
+
+# Start of the line in the buffer if a node with this level renders it exactly as it is there, else None
+def get_origin(buffer, line_start, value_start, line_end, level, blank):
+    if blank:
+        indent = level * 4 * b' '
+        return line_start if buffer[line_start:line_end] in (indent + b'\n', indent + b'\r\n') else None
+    return line_start if buffer[line_start:value_start] == level * 4 * b' ' else None
+
+
+# Adds copies of the descendants of node under node_copy, sizes are copied along
+def clone_children(node, node_copy):
+    stack = [(node, node_copy)]
+    while stack:
+        node, node_copy = stack.pop()
+        children = _node_children.__get__(node)  # unparsed lazy nodes have none
+        if children:
+            copies = [child._copy(node_copy) for child in children]
+            _node_children.__set__(node_copy, copies)
+            stack.extend(zip(children, copies))
+
+
+def link_nodes(father_node, nodes, fathers):
+    for node, father_idx in zip(nodes, fathers):
+        father = nodes[father_idx] if father_idx >= 0 else father_node
+        node.father = father
+        _node_children.__get__(father).append(node)
+
+    # sizes are summed bottom-up once instead of walking the father chain for every new node
+    for node in reversed(nodes):
+        if node.father is not father_node:
+            node.father.size += 1 + node.size
+    father_node.update_size(len(nodes))
+
+
+# Returns the value spans, levels and blank flags of the lines in buffer[start:end], values of empty lines are the
+# empty span at the end of the line
+def scan_lines(buffer, start, end):
+    if numpy is not None and end - start >= max(NUMPY_MIN_BYTES, 1):
+        return scan_lines_numpy(buffer, start, end)
+    value_starts, value_ends, levels, blanks = [], [], [], []
+    for match in MAPPED_LINE.finditer(buffer, start, end):
+        line_start, line_end = match.span()
+        if line_start == line_end:  # end of buffer
+            break
+        value_start = match.end(1)
+        blank = match.end(2) == value_start
+        if blank:
+            value_start = line_end
+        value_starts.append(value_start)
+        value_ends.append(line_end)
+        levels.append((value_start - line_start) // 4)
+        blanks.append(blank)
+    return value_starts, value_ends, levels, blanks
+
+
+# Same as scan_lines, with every line scanned at once: the first byte of each value is the first byte after the
+# line start which isn't indentation, newlines included
+def scan_lines_numpy(buffer, start, end):
+    data = numpy.frombuffer(buffer, dtype=numpy.uint8, count=end - start, offset=start)
+    length = len(data)
+    line_ends = numpy.flatnonzero(data == ord('\n')) + 1
+    if not len(line_ends) or line_ends[-1] != length:  # last line without newline
+        line_ends = numpy.append(line_ends, length)
+    line_starts = numpy.concatenate(([0], line_ends[:-1]))
+    stops = numpy.append(numpy.flatnonzero(~numpy.isin(data, numpy.frombuffer(INDENT_BYTES, numpy.uint8))), length)
+    value_starts = stops[numpy.searchsorted(stops, line_starts)]
+    blanks = (value_starts == length) | (data[numpy.minimum(value_starts, length - 1)] == ord('\n'))
+    value_starts = numpy.where(blanks, line_ends, value_starts)
+    levels = (value_starts - line_starts) // 4
+    return (value_starts + start).tolist(), (line_ends + start).tolist(), levels.tolist(), blanks.tolist()
+
+
+# Parses the lines of buffer[start:end] under father_node, first_line is the line of the first node or None for
+# computed lines
+def build_mapped_children(father_node, buffer, start=0, end=None, first_line=0):
+    value_starts, value_ends, levels, blanks = scan_lines(buffer, start, len(buffer) if end is None else end)
+    fathers = compute_fathers(levels, blanks, father_node.level)
+    line_starts = [start]
+    line_starts.extend(value_ends[:-1])
+    nodes = [MappedNode(buffer, value_start, value_end, line=None if first_line is None else first_line + idx,
+                        level=level, origin=get_origin(buffer, line_start, value_start, value_end, level, blank))
+             for idx, (line_start, value_start, value_end, level, blank)
+             in enumerate(zip(line_starts, value_starts, value_ends, levels, blanks))]
+    link_nodes(father_node, nodes, fathers)
+
+
+# Bytes of the lines of buffer[start:end] rendered as build_mapped_children would parse them under a node of
+# father_level, without creating the nodes
+def render_mapped_lines(buffer, start, end, father_level):
+    value_starts, value_ends, levels, blanks = scan_lines(buffer, start, end)
+    compute_fathers(levels, blanks, father_level)
+    pieces = []
+    for value_start, value_end, level, blank in zip(value_starts, value_ends, levels, blanks):
+        pieces.append(level * 4 * b' ')
+        pieces.append(line_ending(buffer, value_end) if blank else buffer[value_start:value_end])
+    return b''.join(pieces)
+
+
+# Adds the top level lines of the buffer under root as lazy nodes, each holding the lines up to the next one.
+# Lines before the first top level line are parsed right away.
+def build_lazy_children(root, buffer):
+    starts = [match.start() for match in TOP_LEVEL_LINE.finditer(buffer)]
+    if not starts or starts[0] != 0:
+        build_mapped_children(root, buffer, 0, starts[0] if starts else len(buffer), first_line=None)
+    nodes = []
+    for block_start, block_end in zip(starts, starts[1:] + [len(buffer)]):
+        # empty lines right after a top level line are root children too, the last of them holds the block
+        match = MAPPED_LINE.match(buffer, block_start, block_end)
+        while True:
+            line_end = match.end()
+            blank = match.end(2) == match.end(1)
+            value_start = line_end if blank else match.end(1)
+            origin = get_origin(buffer, match.start(), value_start, line_end, 0, blank)
+            next_match = MAPPED_LINE.match(buffer, line_end, block_end) if line_end < block_end else None
+            if next_match is not None and next_match.end(2) == next_match.end(1):
+                nodes.append(LazyNode(buffer, value_start, line_end, line_end, 0, level=0, origin=origin))
+                match = next_match
+                continue
+            body = buffer[line_end:block_end]
+            body_lines = body.count(b'\n')
+            if body and not body.endswith(b'\n'):
+                body_lines += 1
+            nodes.append(LazyNode(buffer, value_start, line_end, block_end, body_lines, level=0, origin=origin))
+            break
+    link_nodes(root, nodes, [-1] * len(nodes))
+    root.update_size(sum(node.size for node in nodes))
+
+
+class RootNode(Node):
+    __slots__ = ('tree',)
+
+    def __init__(self, value, tree=None):
+        super().__init__(value, father_node=None, level=Level.ROOT)
+        self.tree = tree
+
+    def __str__(self):
+        return self.render()
 
 
 class FTree:
-    def __init__(self, file_path, transformer=None, debug=False, test=False):
-        self.root = Node(file_path, father_node=None, level=Level.ROOT)
+    def __init__(self, file_path, transformer=None, debug=False, test=False, computed_lines=False,
+                 memory_map=False, lazy=False, workers=None, source=None, cache=None):
+        # source is the content of the file as str or bytes, when given file_path is only the name of the tree
+        self.root = RootNode(file_path, self)
         self.list_nodes = []
-        self._get_node_list()
         self.curr_line = 0
         self._stop_recursion = False
         self.transformer = transformer
         self.DEBUG = debug
         self.TEST = test
+        self.computed_lines = computed_lines or lazy  # lines of unparsed nodes can't be stored
+        self.memory_map = memory_map
+        self.lazy = lazy
+        self.workers = workers
+        self.cache = cache  # ParseCache or TreeCache of parsed files, also used for the files appended by path
+        self._line_index = None  # stored lines and their nodes sorted by line, built on lookup
+        self._type_index = None  # nodes in pre-order with their values and positions by type, for scoped transformers
+        self._buffer = None  # source of memory_map and lazy trees
+        self._source_stat = None  # identity of the source file, while its content is still the buffer's
+        self._mapped_file = None  # device and inode of the file memory mapped by the buffer, values are read from it
+        self._shared = False  # nodes may share lines with other trees, see SharedNode
+        self._source = source
 
         self._build_reader_tree()
+        self._source = None
+
+    @classmethod
+    def from_string(cls, text, name='<string>', **options):
+        return cls(name, source=text, **options)
+
+    @classmethod
+    def from_lines(cls, lines, name='<lines>', **options):
+        # lines without a line ending get one, lines given as bytes are joined as bytes
+        lines = list(lines)
+        ending = b'\n' if lines and isinstance(lines[0], (bytes, bytearray)) else '\n'
+        text = ending[:0].join(line if line.endswith(ending) else line + ending for line in lines)
+        return cls(name, source=text, **options)
+
+    @classmethod
+    def from_stream(cls, stream, name=None, **options):
+        # reads a file object opened in text or binary mode until its end, it's left open
+        if name is None:
+            name = getattr(stream, 'name', None)
+            if not isinstance(name, str):  # unnamed streams, or the file descriptor of a temporary file
+                name = '<stream>'
+        return cls(name, source=stream.read(), **options)
 
     def __eq__(self, other):
         if isinstance(other, FTree):
-            other._get_node_list()
-            self._get_node_list()
-            len_other = len(other.list_nodes)
-            len_self = len(self.list_nodes)
+            len_other = sum(1 for _ in iter_shared(other.root))
+            len_self = sum(1 for _ in iter_shared(self.root))
             return len_self == len_other and self.root == other.root
         return NotImplemented
 
@@ -166,9 +824,7 @@ class FTree:
         if self.curr_line < len(lines):
             curr_node = Node(lines[self.curr_line],
                              father_node=father_node,
-                             line=self.curr_line,
-                             debug=self.DEBUG,
-                             test=self.TEST)
+                             line=self.curr_line)
 
             while curr_node.level >= father_node.level + 1:
                 father_node.add_child(curr_node)
@@ -178,9 +834,7 @@ class FTree:
                 if self.curr_line < len(lines):
                     curr_node = Node(lines[self.curr_line],
                                      father_node=father_node,
-                                     line=self.curr_line,
-                                     debug=self.DEBUG,
-                                     test=self.TEST)
+                                     line=self.curr_line)
                     if curr_node.has_value(''):
                         curr_node.level = father_node.level + 1
                 else:
@@ -196,93 +850,717 @@ class FTree:
             if curr_node and curr_node.level < father_node.level + 1:
                 return curr_node
 
+    def _build_children(self, father_node, lines):
+        self._add_nodes(father_node, *parse_lines(lines, father_node.level))
+
+    def _add_nodes(self, father_node, values, levels, fathers):
+        nodes = [Node(value, line=None if self.computed_lines else idx, level=level)
+                 for idx, (value, level) in enumerate(zip(values, levels))]
+        link_nodes(father_node, nodes, fathers)
+
+    def _parse_parallel(self, buffer):
+        # chunks split on level 0 lines are parsed independently by the workers, since a level 0 line closes every
+        # open parent. Nodes can't be sent back cheaply, so the workers return levels and fathers and the nodes are
+        # created in this process, while the workers run the values are stripped here.
+        bounds = split_top_level(buffer, self.workers)
+        if len(bounds) == 2:
+            return parse_lines(read_lines(buffer))
+        with ProcessPoolExecutor(self.workers) as pool:
+            futures = [pool.submit(parse_chunk, self.root.value, start, end)
+                       for start, end in zip(bounds, bounds[1:])]
+            lines = read_lines(buffer)
+            values = [line.lstrip() for line in lines]
+            levels, fathers = array('i'), array('i')
+            for future in futures:
+                chunk_levels, chunk_fathers = future.result()
+                if levels and chunk_levels[0] != 0:  # split on a line indented with other whitespace, parse serially
+                    return parse_lines(lines)
+                offset = len(levels)
+                levels.extend(chunk_levels)
+                fathers.extend(father + offset if father >= 0 else -1 for father in chunk_fathers)
+        return values, levels, fathers
+
+    def _parse_file(self, data):
+        if self.workers and self.workers > 1:
+            return self._parse_parallel(data)
+        return parse_lines(read_lines(data))
+
     def _build_reader_tree(self):
-        with open(self.root.value, 'r') as f:
-            lines = f.readlines()
-        self._build_direct_children(self.root, lines)
-        self._stop_recursion = False
-        self.curr_line = 0
+        if self._source is not None:
+            self._build_source_tree(self._source)
+        elif self.memory_map or self.lazy:
+            with open(self.root.value, 'rb') as f:
+                if not self.memory_map:
+                    buffer = f.read()
+                else:
+                    try:
+                        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    except ValueError:  # empty files can't be mapped
+                        return
+                stat = os.fstat(f.fileno())
+                self._source_stat = get_file_stat(stat)
+                if self.memory_map:
+                    self._mapped_file = stat.st_dev, stat.st_ino
+            self._build_buffer_tree(buffer)
+        elif self.cache is not None:
+            self._add_nodes(self.root, *self.cache.get(self.root.value, self._parse_file))
+        elif self.workers and self.workers > 1:
+            with open(self.root.value, 'rb') as f:
+                buffer = f.read()
+            self._add_nodes(self.root, *self._parse_parallel(buffer))
+        else:
+            with open(self.root.value, 'r') as f:
+                lines = f.readlines()
+            self._build_children(self.root, lines)
+
+    def _build_buffer_tree(self, buffer):
+        self._buffer = buffer
+        if self.lazy:
+            build_lazy_children(self.root, buffer)
+        else:
+            build_mapped_children(self.root, buffer, first_line=None if self.computed_lines else 0)
+
+    def _build_source_tree(self, source):
+        # same parsers as for files, workers are not used since they read their chunk from the file
+        if self.memory_map or self.lazy:
+            self._build_buffer_tree(source.encode() if isinstance(source, str) else bytes(source))
+        elif isinstance(source, str):
+            self._build_children(self.root, io.StringIO(source, newline=None).readlines())
+        else:
+            self._build_children(self.root, read_lines(source))
 
     def _get_node_list(self):
-        self.list_nodes = []
-        self.root.get_node_list(self.list_nodes)
+        self.list_nodes = list(self.iter_nodes())
+
+    def iter_nodes(self):
+        # nodes of the tree in pre-order, root excluded
+        nodes = self.root.iter_subtree()
+        next(nodes)
+        yield from nodes
 
     def _update_lines_globally(self, line_tresh, offset):
-        self.root.update_lines_globally(line_tresh, offset)
-
-    def _get_node_by_line(self, node, line):
-        if not self._stop_recursion:
-            if node.line == line:
-                self._stop_recursion = True
-                return node
-            for child in node.children:
-                found_node = self._get_node_by_line(child, line)
-                if self._stop_recursion:
-                    return found_node
+        if not self.computed_lines:
+            self.root.update_lines_globally(line_tresh, offset)
+            self._line_index = None
+
+    def _set_computed_lines(self, computed_lines):
+        # switch how the lines of this tree's nodes are kept, i.e. before appending it to another tree
+        if computed_lines != self.computed_lines:
+            for idx, node in enumerate(self.iter_nodes()):
+                node.line = None if computed_lines else idx + 1
+            self.computed_lines = computed_lines
+            self._line_index = None
+
+    def _build_line_index(self):
+        lines, nodes = [], []
+        for node in self.root.iter_subtree():
+            lines.append(node.line)
+            nodes.append(node)
+        if any(line > next_line for line, next_line in zip(lines, lines[1:])):  # lines were changed by hand
+            order = sorted(range(len(lines)), key=lines.__getitem__)
+            lines = [lines[idx] for idx in order]
+            nodes = [nodes[idx] for idx in order]
+        self._line_index = lines, nodes
+
+    def _get_node_by_line(self, line):
+        # the index is dropped by the tree's own changes, changes made directly on nodes are caught by checking the
+        # found node and rebuilding once
+        while True:
+            fresh = self._line_index is None
+            if fresh:
+                self._build_line_index()
+            lines, nodes = self._line_index
+            idx = bisect_left(lines, line)
+            if idx < len(lines) and lines[idx] == line:
+                node = nodes[idx]
+                if node.line == line and node.get_root() is self.root:
+                    return node
+            if fresh:
+                return None
+            self._line_index = None
 
     def set_transformer(self, new_transformer):
-        if self.transformer:
-            self.transformer.extend(new_transformer)
-        else:
-            self.transformer = new_transformer
+        self.transformer = merge_transformer(self.transformer, new_transformer)
 
     # TODO: add get_nodes_by_value(self, value)
     def get_node_by_line(self, line):
-        self._stop_recursion = False
-        node = self._get_node_by_line(self.root, line)
+        if self.computed_lines:
+            node = self.root.get_descendant_by_line(line)
+        else:
+            node = self._get_node_by_line(line)
         if not node:
             raise Exception(f'No node at line {line}')
         return node
 
-    def append(self, obj, line=-1, transformer=None):
-        # TODO: append node as a copy of parameter node: useful for repetitive appends with the same node
+    def clone(self, share=False):
+        # copy of the tree made without parsing again, see Node.clone. With share, the nodes of this tree become the
+        # source of SharedNodes in both trees, lines are only copied when they are reached to be changed.
+        share = share and not self.memory_map and not self.lazy  # values would be decoded to be shared
+        if share:
+            self._set_computed_lines(True)
+        tree = FTree(self.root.value, copy.copy(self.transformer), self.DEBUG, self.TEST, self.computed_lines,
+                     self.memory_map, self.lazy, self.workers, source='', cache=self.cache)
+        tree._shared = self._shared
+        if share:
+            snapshot = self._share_children()
+            tree.root.children = [share_node(child, tree.root) for child in snapshot]
+            tree.root.size = self.root.size
+            tree._shared = True
+            return tree
+        tree._buffer = self._buffer
+        tree._mapped_file = self._mapped_file
+        if isinstance(self._buffer, mmap.mmap):  # patching the file in place would change the clone's values
+            self._source_stat = None
+        clone_children(self.root, tree.root)
+        tree.root.size = self.root.size
+        return tree
+
+    def _share_children(self):
+        # the nodes under root become a snapshot which is never changed, root gets SharedNodes of them.
+        # The snapshot is detached from root, so nodes taken from the tree before are no longer in it.
+        # Returns the snapshot.
+        snapshot = self.root.children
+        self.root.children = [share_node(child, self.root) for child in snapshot]
+        for node in snapshot:
+            node.father = None
+        self.root._offsets = None
+        self._line_index = None
+        self._type_index = None
+        self._shared = True
+        return snapshot
+
+    def append(self, obj, line=-1, transformer=None, copy=False, share=False):
+        # with copy, a clone of the FTree obj is appended and obj can be appended again, with share the clone shares
+        # its lines with obj (see clone). A Node obj is always copied, with the lines under it.
+        if share and isinstance(obj, FTree) and not obj.memory_map and not obj.lazy:
+            self._set_computed_lines(True)
+            obj = obj.clone(share=True)
+        elif (copy or share) and isinstance(obj, FTree):
+            obj = obj.clone()
         if isinstance(obj, FTree):
+            if isinstance(obj._buffer, mmap.mmap) and obj._buffer is not self._buffer:
+                obj._copy_mapped_values()  # its file could be written over while this tree reads it
+            self._shared = self._shared or obj._shared
             if transformer:
                 obj.set_transformer(transformer)
                 obj.apply_transformer()
+            obj._set_computed_lines(self.computed_lines)
+            self._line_index = None
+            self._type_index = None
             children_to_append = obj.root.children
             if line == -1:  # append to the end of tree: move children from root to root and update lines
-                self.root.add_children(children_to_append, debug=self.DEBUG)
+                self.root.add_children(children_to_append)
             else:
                 curr_node = self.get_node_by_line(line)
                 offset = Node.get_real_length(children_to_append)
                 self._update_lines_globally(line, offset)
-                curr_node.father.add_children(children_to_append, curr_node, line, debug=self.DEBUG)
+                curr_node.father.add_children(children_to_append, curr_node, line)
+        elif isinstance(obj, Node):
+            node = obj.clone()
+            node.update_level(Level.ROOT)
+            tree = getattr(obj.get_root(), 'tree', None)
+            stored = tree is None or not tree.computed_lines  # else the lines are already computed
+            for descendant in node.iter_subtree():
+                if stored:
+                    descendant.line = None
+                if isinstance(descendant, MappedNode) and isinstance(descendant._buffer, mmap.mmap):
+                    descendant.detach_value()  # the source file can be patched in place
+            ftree = FTree.from_string('', computed_lines=True)
+            ftree.root.add_child(node)
+            ftree._shared = tree is not None and tree._shared
+            self.append(ftree, line=line, transformer=transformer)
         elif isinstance(obj, str):
-            ftree = FTree(obj)
+            ftree = FTree(obj, cache=self.cache)
             self.append(ftree, line=line, transformer=transformer)
 
-    def write_to(self, path, mode='a+', apply_transformer=False):
+    def write_to(self, path, mode='a+', apply_transformer=False, incremental=False):
+        # path can also be a writable file object, text or binary, it's left open
         if apply_transformer:
             self.apply_transformer()
-        self._get_node_list()
+        if hasattr(path, 'write'):
+            self._write_file(path)
+            return
+        if incremental:
+            self._write_incremental(path)
+            return
+        if 'a' not in mode and 'x' not in mode and self._maps_path(path):
+            self._replace_file(path, self._write_file)  # truncating the mapped file would crash reading the values
+            return
+        if self._renders_mapped():
+            with open(path, mode=mode if 'b' in mode else mode + 'b') as f:
+                f.writelines(self._mapped_chunks())
+            return
         with open(path, mode=mode) as f:
-            for node in self.list_nodes:
-                if node.value == '':
-                    node.value = '\n'
-                f.write(node.__str__())
+            f.writelines(self._render_chunks(self.DEBUG, self.TEST))
+
+    def to_string(self, apply_transformer=False):
+        if apply_transformer:
+            self.apply_transformer()
+        return ''.join(self._text_chunks())
+
+    def iter_lines(self):
+        # the lines of to_string, rendered a chunk at a time
+        rest = ''
+        for chunk in self._text_chunks():
+            lines = (rest + chunk).split('\n')
+            rest = lines.pop()
+            for line in lines:
+                yield line + '\n'
+        if rest:
+            yield rest
+
+    def _write_file(self, f):
+        try:
+            stat = os.fstat(f.fileno())
+        except (AttributeError, OSError, ValueError):  # not a file, i.e. io.StringIO
+            stat = None
+        if stat is not None and self._maps_file(stat):
+            if stat.st_size < len(self._buffer):
+                raise Exception('Memory mapped source file was truncated, write the tree to its path instead')
+            self._copy_mapped_values()  # the file is written over the values
+        if isinstance(f, (io.RawIOBase, io.BufferedIOBase)) or 'b' in getattr(f, 'mode', ''):
+            if self._renders_mapped():
+                f.writelines(self._mapped_chunks())
+            else:
+                f.writelines(chunk.encode() for chunk in self._render_chunks(self.DEBUG, self.TEST))
+        else:
+            f.writelines(self._text_chunks())
+
+    def _maps_file(self, stat):
+        # whether the values are read from a memory map of the file of stat
+        return self._mapped_file is not None and self._mapped_file == (stat.st_dev, stat.st_ino)
+
+    def _maps_path(self, path):
+        try:
+            return self._maps_file(os.stat(path))
+        except OSError:
+            return False
+
+    def _copy_mapped_values(self):
+        # nodes stop reading the memory mapped source, the lines under lazy nodes are parsed first
+        for node in self.iter_nodes():
+            if isinstance(node, MappedNode) and isinstance(node._buffer, mmap.mmap):
+                node.detach_value()
+        self._mapped_file = None
+
+    def _renders_mapped(self):
+        return (self.memory_map or self.lazy) and not self.DEBUG and not self.TEST
+
+    def _text_chunks(self):
+        # chunks end on whole lines, so the bytes of mapped trees are decoded a chunk at a time
+        if self._renders_mapped():
+            return (chunk.decode() for chunk in self._mapped_chunks())
+        return self._render_chunks(self.DEBUG, self.TEST)
+
+    def _render_chunks(self, debug=False, test=False):
+        # the rendered lines of the tree joined in chunks of WRITE_CHUNK lines, empty values are written as a newline.
+        # Indentations are built once per level.
+        if self._shared and not debug:
+            yield from self._render_shared_chunks(test)
+            return
+        pieces = []
+        indents = {}
+        for node in self.iter_nodes():
+            if debug:
+                pieces.append(node.render(debug, test, empty='\n'))
+            else:
+                if not test:
+                    indent = indents.get(node.level)
+                    if indent is None:
+                        indent = indents[node.level] = node.level * 4 * ' '
+                    pieces.append(indent)
+                pieces.append(node.value or '\n')
+            if len(pieces) >= WRITE_CHUNK:
+                yield ''.join(pieces)
+                pieces = []
+        if pieces:
+            yield ''.join(pieces)
+
+    def _render_shared_chunks(self, test=False):
+        # same as _render_chunks, the lines still shared are rendered from their source without copying them
+        pieces = []
+        indents = {}
+        for node, delta in iter_shared(self.root):
+            if not test:
+                level = node.level + delta
+                indent = indents.get(level)
+                if indent is None:
+                    indent = indents[level] = level * 4 * ' '
+                pieces.append(indent)
+            pieces.append(node.value or '\n')
+            if len(pieces) >= WRITE_CHUNK:
+                yield ''.join(pieces)
+                pieces = []
+        if pieces:
+            yield ''.join(pieces)
+
+    def _mapped_chunks(self):
+        # unchanged mapped values are copied from the source as bytes, without decoding them,
+        # lines under lazy nodes which were never parsed are rendered without parsing them
+        pieces = []
+        for piece in self._mapped_pieces():
+            pieces.append(piece)
+            if len(pieces) >= WRITE_CHUNK:
+                yield b''.join(pieces)
+                pieces = []
+        if pieces:
+            yield b''.join(pieces)
+
+    def _iter_mapped_nodes(self):
+        # nodes in pre-order, without parsing the lines under lazy nodes
+        stack = list(reversed(self.root.children))
+        while stack:
+            node = stack.pop()
+            yield node
+            if not isinstance(node, LazyNode) or node.is_parsed():
+                stack.extend(reversed(node.children))
+
+    def _mapped_pieces(self, source=None):
+        # bytes of the tree, the lines still written as they are in source (see MappedNode.get_origin) and unparsed
+        # lazy blocks of it are given as their (start, end) span in source instead
+        for node in self._iter_mapped_nodes():
+            mapped = isinstance(node, MappedNode)
+            origin = node.get_origin(source) if mapped and source is not None else None
+            if origin is not None:
+                yield origin
+            else:
+                raw_value = node.get_raw_value() if mapped else None
+                if raw_value is None:
+                    yield node.render(empty='\n').encode()
+                else:
+                    yield node.level * 4 * b' '
+                    yield raw_value or line_ending(node._buffer, node._end)  # empty values keep their line ending
+            if isinstance(node, LazyNode) and not node.is_parsed():
+                origin = node.get_body_origin(source) if source is not None else None
+                yield node.get_rendered_body() if origin is None else origin
+
+    def _write_incremental(self, path):
+        # The file at path is replaced by a temporary file renamed over it, where the lines unchanged since they were
+        # read are copied from the source buffer and only the changed ones are rendered. When path is still the source
+        # file and the changed lines kept their length, only they are written, in place.
+        if self._buffer is None or self.DEBUG or self.TEST:
+            self._replace_file(path, lambda f: f.writelines(self._render_chunks(self.DEBUG, self.TEST)), text=True)
+            return
+        segments = []  # (offset in the new file, span in the source or bytes)
+        length = 0
+        for piece in self._mapped_pieces(self._buffer):
+            if isinstance(piece, tuple):
+                previous = segments[-1][1] if segments else None
+                if isinstance(previous, tuple) and previous[1] == piece[0]:
+                    segments[-1] = (segments[-1][0], (previous[0], piece[1]))
+                else:
+                    segments.append((length, piece))
+                length += piece[1] - piece[0]
+            elif piece:
+                if segments and isinstance(segments[-1][1], list):
+                    segments[-1][1].append(piece)
+                else:
+                    segments.append((length, [piece]))
+                length += len(piece)
+
+        if length == len(self._buffer) and self._is_source(path) and \
+                all(offset == data[0] for offset, data in segments if isinstance(data, tuple)):
+            self._patch_source(path, [(offset, b''.join(data)) for offset, data in segments if isinstance(data, list)])
+            return
+
+        def write(f):
+            with memoryview(self._buffer) as view:
+                for _, data in segments:
+                    if isinstance(data, tuple):
+                        f.write(view[data[0]:data[1]])
+                    else:
+                        f.writelines(data)
+        self._replace_file(path, write)
+
+    def _is_source(self, path):
+        try:
+            return get_file_stat(os.stat(path)) == self._source_stat
+        except OSError:
+            return False
+
+    def _patch_source(self, path, patches):
+        # the values of the changed lines are in the patched ranges, so the nodes still reading them from the buffer get
+        # their own copy first
+        for node in self._iter_mapped_nodes():
+            if isinstance(node, MappedNode) and node._buffer is self._buffer and node.get_origin(self._buffer) is None:
+                node.detach_value()
+        with open(path, 'r+b') as f:
+            for offset, data in patches:
+                f.seek(offset)
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            self._source_stat = get_file_stat(os.fstat(f.fileno()))
+
+    @staticmethod
+    def _replace_file(path, write, text=False):
+        # atomic: path is either the old or the new file, never a partly written one
+        directory, name = os.path.split(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w' if text else 'wb') as f:
+                write(f)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(path):
+                shutil.copymode(path, temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
 
     def print_tree(self):
-        self.root.print_tree()
+        print(self.root, end='')
+        for node in self.iter_nodes():
+            end = '\n' if self.DEBUG or not node.value else ''
+            print(node.render(self.DEBUG, self.TEST), end=end)
 
-    def apply_transformer(self):
-        # TODO: specify lines/threshold line for which to apply this list of funcs: is this really useful?
+    def apply_transformer(self, workers=None, lines=None, types=None, node=None):
         # TODO: allow multiple parameters for functions:  try this in another function
         #  use syntax -> transformer = [(func1, *args), (lambda x, *args: ..., (arg1, arg2))
-        self._get_node_list()
-        if self.transformer:
-            for node in self.list_nodes:
-                for func in self.transformer:
-                    val = func(node.value)
-                    if isinstance(val, tuple) or val is None:
-                        val = tuple([val]) if not isinstance(val, tuple) else val
-                        if val[0] is None:
-                            keep = val[1] if len(val) == 2 else True
-                            node.delete(keep)
-                            offset = -1 if keep else (-1) * Node.get_real_length(node.children)
-                            self._update_lines_globally(node.line, offset)
-                            break
-                    else:
-                        node.value = val
-        else:
+        if not self.transformer:
             raise Exception("Transformer empty")
+        scoped = lines is not None or types is not None or node is not None
+        targets = self._get_scope(lines, types, node) if scoped else None
+        run = get_runner(self.transformer)
+        if workers and workers > 1 and self._is_picklable(self.transformer):
+            results = self._transform_values(workers, targets)
+
+            def run(value):
+                return results.get(value) or (value, None)
+
+        if not scoped:
+            self._type_index = None  # every value may have changed
+            kept = self._transform_children(self.root, run)
+            if kept is not None:
+                self._line_index = None
+                self._update_sizes(kept)
+                self._renumber_lines(kept)
+            return
+        deleted = self._transform_nodes(targets, run)
+        if deleted:
+            self._line_index = None
+            self._type_index = None
+            # ancestors of the deleted nodes are the only children lists to rebuild
+            affected = set()
+            for deleted_node, _ in deleted.values():
+                father = deleted_node.father
+                while father is not None and id(father) not in affected:
+                    affected.add(id(father))
+                    father = father.father
+            kept = self._transform_children(self.root, run, deleted, affected)
+            self._update_sizes(kept)
+            self._renumber_lines()
+
+    def _get_scope(self, lines, types, node):
+        # nodes to transform in pre-order: the lines in a range, the subtree of a node, the nodes of some Types or the
+        # nodes matching all of them
+        if types is not None:
+            types = set(types)
+        if lines is not None and not (isinstance(lines, range) and lines.step == 1):
+            lines = sorted(set(lines))  # any lines, in the order of the tree
+        if node is not None:
+            if node.get_root() is not self.root:
+                raise Exception('Node is not in this tree')
+            targets = self._iter_following(node, node.size + 1)
+            if node is self.root:
+                next(targets)  # the root holds the file path, same as iter_nodes
+        elif isinstance(lines, range):
+            first = max(lines.start, 1)
+            if first >= lines.stop or first > self.root.size:
+                return []
+            targets = self._iter_following(self.get_node_by_line(first), min(lines.stop, self.root.size + 1) - first)
+        elif lines is not None:
+            targets = (self.get_node_by_line(line) for line in lines if 1 <= line <= self.root.size)
+        else:
+            targets = self._get_nodes_by_types(types)
+        if lines is not None and node is not None:
+            lines = lines if isinstance(lines, range) else set(lines)
+            targets = (target for target in targets if target.line in lines)
+        if types is not None and (lines is not None or node is not None):
+            targets = (target for target in targets if target.type in types)
+        return list(targets)
+
+    @staticmethod
+    def _iter_following(node, count):
+        # node and the nodes after it in pre-order
+        while count:
+            yield node
+            count -= 1
+            children = node.children
+            if children:
+                node = children[0]
+                continue
+            while node.father is not None:
+                father = node.father
+                position = father.get_position(node) + 1
+                if position < len(father.children):
+                    node = father.children[position]
+                    break
+                node = father
+            else:
+                return
+
+    def _get_nodes_by_types(self, types):
+        # the index keeps the nodes in pre-order with the values they had, it's rebuilt when the tree or a value was
+        # changed directly since (one comparison of the values, done in C)
+        index = self._type_index
+        if index is not None:
+            nodes, values, _ = index
+            if len(nodes) != self.root.size or list(map(_node_value.__get__, nodes)) != values:
+                index = None
+        if index is None:
+            nodes = list(self.iter_nodes())
+            by_type = {}
+            for position, node in enumerate(nodes):
+                by_type.setdefault(node.type, []).append((position, node))
+            index = self._type_index = nodes, list(map(_node_value.__get__, nodes)), by_type
+        nodes = heapq.merge(*(index[2].get(node_type, []) for node_type in types))
+        return (node for _, node in nodes if node.type in types and node.get_root() is self.root)
+
+    def _transform_nodes(self, nodes, run):
+        # transforms the values of the nodes, returns the deleted nodes with their keep_children by id. The lines under
+        # a node deleted without its children are skipped.
+        deleted = {}
+        dropped_end = None  # last line under the last node deleted without its children
+        for node in nodes:
+            if dropped_end is not None:
+                if node.line <= dropped_end:
+                    continue
+                dropped_end = None
+            old_value = node.value
+            value, keep = run(old_value)
+            if value is None:
+                deleted[id(node)] = node, bool(keep)
+                if not keep:
+                    dropped_end = node.line + node.size
+            elif value is not old_value:
+                if self._type_index is None:
+                    node.value = value
+                else:
+                    self._set_indexed_value(node, value)
+        return deleted
+
+    def _set_indexed_value(self, node, value):
+        # the value is kept in the index and the entry of the node moves to its new type, positions of the nodes are
+        # their lines - 1
+        nodes, values, by_type = self._type_index
+        old_type = node.type
+        node.value = value
+        position = node.line - 1
+        if position >= len(nodes) or nodes[position] is not node:  # the tree was changed directly since it was built
+            self._type_index = None
+            return
+        values[position] = _node_value.__get__(node)
+        new_type = node.type
+        if new_type is old_type:
+            return
+        entries = by_type[old_type]
+        del entries[bisect_left(entries, (position,))]
+        entries = by_type.setdefault(new_type, [])
+        entries.insert(bisect_left(entries, (position,)), (position, node))
+
+    def _transform_children(self, father, run, deleted=None, affected=None):
+        # Deletions are applied while walking the tree: the children lists are rebuilt in pre-order, children of nodes
+        # deleted with keep_children go to the closest kept ancestor (levels recomputed, same as Node.delete) and the
+        # subtrees of nodes deleted without them are skipped. Returns the nodes whose children were rebuilt, None when
+        # nothing was deleted.
+        # Values of the deleted nodes can be given already transformed, then only the affected nodes (ancestors of
+        # deleted nodes) are walked into.
+        # The lines under a SharedNode are transformed from its source first, it stays shared when none of them changes.
+        kept = []
+        removed = False
+        results = {}  # results of the shared lines by id of their source node
+        known = {}  # results of the SharedNodes copied from those source nodes
+        stack = [(iter(father.children), father, False)]
+        father.children = []
+        while stack:
+            children, father, moved = stack[-1]
+            node = next(children, None)
+            if node is None:
+                stack.pop()
+                continue
+            if deleted is None:
+                old_value = node.value
+                result = known.pop(id(node), None) if known else None
+                value, keep = run(old_value) if result is None else result
+                if value is not None and value is not old_value:
+                    node.value = value
+                remove = value is None
+            else:
+                _, keep = deleted.get(id(node), (None, None))
+                remove = keep is not None
+            if remove:
+                removed = True
+                node.father = None
+                if keep:
+                    stack.append((iter(node.children), father, True))
+                continue
+            if moved:
+                node.level = father.level + 1
+            node.father = father
+            father.children.append(node)
+            if affected is None or moved or id(node) in affected:
+                source = node._source if deleted is None and type(node) is SharedNode else None
+                if source is not None:
+                    if (not moved or levels_follow(source)) and self._is_unchanged(source, run, results):
+                        continue
+                    for child, source_child in zip(node.children, source.children):
+                        result = results.get(id(source_child))
+                        if result is not None:
+                            known[id(child)] = result
+                kept.append(node)
+                stack.append((iter(node.children), node, moved))
+                node.children = []
+        return kept if removed else None
+
+    @staticmethod
+    def _is_unchanged(source, run, results):
+        # whether the transformer changes none of the lines under source, which are transformed at most once
+        for node, _ in iter_shared(source):
+            value = node.value
+            result = results.get(id(node))
+            if result is None:
+                result = results[id(node)] = run(value)
+            if result[0] is not value:
+                return False
+        return True
+
+    def _update_sizes(self, nodes):
+        # nodes whose children were rebuilt in pre-order, the children of the others didn't change
+        for node in reversed(nodes):
+            node.size = Node.get_real_length(node.children)
+            node._offsets = None
+        self.root.size = Node.get_real_length(self.root.children)
+        self.root._offsets = None
+
+    def _renumber_lines(self, nodes=None):
+        # nodes of the whole tree in pre-order
+        if self.computed_lines:
+            return
+        for idx, node in enumerate(self.iter_nodes() if nodes is None else nodes):
+            node.line = idx + 1
+
+    @staticmethod
+    def _is_picklable(transformer):
+        # lambdas and local functions can't be sent to worker processes, the transformer is applied serially then
+        try:
+            pickle.dumps(transformer)
+        except (pickle.PicklingError, AttributeError, TypeError):
+            return False
+        return True
+
+    def _transform_values(self, workers, nodes=None):
+        # transformer functions only see the value, so every distinct value is transformed once, in batches over a
+        # process pool. Returns the results of the values which changed.
+        if nodes is None:
+            nodes = (node for node, _ in iter_shared(self.root))  # shared lines are read from their source
+        values = list(dict.fromkeys(node.value for node in nodes))
+        size = max(1, -(-len(values) // (workers * 4)))
+        batches = [values[idx:idx + size] for idx in range(0, len(values), size)]
+        results = {}
+        with ProcessPoolExecutor(workers, initializer=init_transform_worker, initargs=(self.transformer,)) as pool:
+            for batch, batch_results in zip(batches, pool.map(transform_batch, batches)):
+                results.update((value, result) for value, result in zip(batch, batch_results) if result is not None)
+        return results
+
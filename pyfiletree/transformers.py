@@ -0,0 +1,171 @@
+import re
+from functools import lru_cache, partial
+
+# flags a regex can scope to a group, (?i) and the like are only allowed at the start of the combined regex
+SCOPED_FLAGS = ((re.ASCII, 'a'), (re.IGNORECASE, 'i'), (re.MULTILINE, 'm'), (re.DOTALL, 's'), (re.VERBOSE, 'x'))
+GLOBAL_FLAGS = re.compile(r'\(\?[aiLmsux]+\)')
+
+
+class Pure:
+    # marks a transformer function as str -> str: it never deletes the line, so its result isn't checked
+    __slots__ = ('func',)
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, value):
+        return self.func(value)
+
+    def __reduce__(self):
+        return Pure, (self.func,)
+
+    def __repr__(self):
+        return f'pure({self.func!r})'
+
+
+def pure(func):
+    return Pure(func)
+
+
+class Pipeline:
+    # Transformer functions fused into one generated function, which runs them in order on a line and returns as soon
+    # as one of them deletes it. Works anywhere a transformer list does, FTree runs it through `run`.
+    def __init__(self, functions=()):
+        self.functions = list(functions)
+        self.run = self._compile()
+
+    def __iter__(self):
+        return iter(self.functions)
+
+    def __reduce__(self):
+        # the generated function can't be pickled, it's generated again from the functions
+        return Pipeline, (self.functions,)
+
+    def __len__(self):
+        return len(self.functions)
+
+    def __call__(self, value):
+        # as a single transformer function
+        value, keep = self.run(value)
+        return value if keep is None else (None, keep)
+
+    def extend(self, functions):
+        self.functions.extend(functions)
+        self.run = self._compile()
+
+    def _compile(self):
+        # same checks as ftree.run_transformer, written out for every function which isn't pure
+        namespace = {}
+        lines = ['def run(value):']
+        for idx, func in enumerate(self.functions):
+            name = f'f{idx}'
+            if isinstance(func, Pure):
+                namespace[name] = func.func
+                lines.append(f'    value = {name}(value)')
+                continue
+            namespace[name] = func
+            lines += [f'    val = {name}(value)',
+                      '    if val is None:',
+                      '        return None, True',
+                      '    if isinstance(val, tuple):',
+                      '        if val[0] is None:',
+                      '            return None, val[1] if len(val) == 2 else True',
+                      '    else:',
+                      '        value = val']
+        lines.append('    return value, None')
+        exec('\n'.join(lines), namespace)
+        return namespace['run']
+
+
+class Memoized(Pipeline):
+    # Pipeline keeping the results of the last maxsize distinct lines, for transformers whose result only depends on
+    # the line (deterministic, no side effects). Repeated lines (empty lines, pass, decorators...) are transformed once.
+    # The cache is emptied when functions are added. With apply_transformer(workers=N) every worker has its own cache.
+    def __init__(self, functions=(), maxsize=1024):
+        self.maxsize = maxsize
+        super().__init__(functions)
+
+    def __reduce__(self):
+        return Memoized, (self.functions, self.maxsize)
+
+    @property
+    def hits(self):
+        return self.run.cache_info().hits
+
+    @property
+    def misses(self):
+        return self.run.cache_info().misses
+
+    def cache_info(self):
+        return self.run.cache_info()
+
+    def cache_clear(self):
+        self.run.cache_clear()
+
+    def _compile(self):
+        # unchanged lines are cached as None and given back as they came, an equal line seen before isn't the same
+        # object and would count as changed
+        compiled = super()._compile()
+
+        def transform(value):
+            result = compiled(value)
+            return None if result[0] is value else result
+        cached = lru_cache(self.maxsize)(transform)
+
+        def run(value):
+            result = cached(value)
+            return (value, None) if result is None else result
+        run.cache_info = cached.cache_info
+        run.cache_clear = cached.cache_clear
+        return run
+
+
+class Replacer(Pure):
+    # Replaces every pattern in a line with one pass of a combined regex, instead of a chain of str.replace.
+    # rules is a mapping or pairs of pattern -> replacement. Literal patterns are tried longest first, so the longest
+    # one matching at a position wins. With regex=True the patterns are regexes tried in order and replacements are
+    # expanded as in re.sub (backreferences inside the patterns are not supported). Flags of a pattern, compiled with it
+    # or given inline as (?i), only apply to that pattern.
+    # Replacements are made on the original line, the result of a rule is never matched by another one.
+    __slots__ = ('rules', 'regex', 'pattern')
+
+    def __init__(self, rules, regex=False):
+        self.rules = list(rules.items() if isinstance(rules, dict) else rules)
+        self.regex = regex
+        if regex:
+            patterns = [re.compile(pattern) for pattern, _ in self.rules]
+            self.pattern = re.compile('|'.join(f'(?P<r{idx}>{scope_flags(pattern)})'
+                                               for idx, pattern in enumerate(patterns)) or '(?!)')
+
+            def replace(match):
+                idx = int(match.lastgroup[1:])
+                repl = self.rules[idx][1]
+                rule_match = patterns[idx].match(match.string, match.start())
+                return repl(rule_match) if callable(repl) else rule_match.expand(repl)
+        else:
+            replacements = dict(self.rules)
+            self.pattern = re.compile('|'.join(re.escape(pattern) for pattern in sorted(replacements, key=len,
+                                                                                         reverse=True)) or '(?!)')
+
+            def replace(match):
+                return replacements[match.group()]
+        super().__init__(partial(self.pattern.sub, replace))
+
+    def __reduce__(self):
+        return Replacer, (self.rules, self.regex)
+
+    def __repr__(self):
+        return f'Replacer({self.rules!r}, regex={self.regex})'
+
+
+def scope_flags(pattern):
+    # text of a compiled regex with its flags scoped to it, to be combined with other regexes
+    text = pattern.pattern
+    match = GLOBAL_FLAGS.match(text)
+    while match:
+        text = text[match.end():]
+        match = GLOBAL_FLAGS.match(text)
+    flags = ''.join(letter for flag, letter in SCOPED_FLAGS if pattern.flags & flag)
+    if not flags:
+        return text
+    return f'(?{flags}:{text}\n)' if pattern.flags & re.VERBOSE else f'(?{flags}:{text})'  # a comment ends the line
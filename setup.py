@@ -17,6 +17,9 @@ setup(
       "dev": [
           "pytest>=4.4.1",
       ],
+      "numpy": [
+          "numpy",
+      ],
     },
     test_suite='tests',
     long_description=long_description,
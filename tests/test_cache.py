@@ -0,0 +1,103 @@
+import os
+
+from pyfiletree.cache import ParseCache, TreeCache
+from pyfiletree.ftree import FTree
+
+
+def old_copy(tmp_path, name, content):
+    # mtime far enough in the past for the entry to be trusted without reading the file
+    path = tmp_path / name
+    path.write_bytes(content)
+    os.utime(str(path), ns=(10 ** 18, 10 ** 18))
+    return str(path)
+
+
+def nodes(tree):
+    return [(node.value, node.level, node.line) for node in tree.iter_nodes()]
+
+
+def test_parse_cache(tmp_path):
+    with open('tests/test.py', 'rb') as f:
+        content = f.read()
+    path = old_copy(tmp_path, 'a.py', content)
+    cache = ParseCache(str(tmp_path / 'cache'))
+    for options in ({}, {'computed_lines': True}, {'workers': 2}):
+        assert nodes(FTree(path, cache=cache, **options)) == nodes(FTree('tests/test.py'))
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    calls = []
+
+    def parse(data):
+        calls.append(data)
+        return [], [], []
+    assert cache.get(path, parse)[0][:1] == ['import library\n']
+    assert not calls
+
+    os.utime(path, ns=(2 * 10 ** 18, 2 * 10 ** 18))  # touched, same content
+    assert nodes(FTree(path, cache=cache)) == nodes(FTree('tests/test.py'))
+    assert cache.misses == 1
+
+    with open('tests/test1_not_equal.py', 'rb') as f:
+        old_copy(tmp_path, 'a.py', f.read())
+    assert nodes(FTree(path, cache=cache)) == nodes(FTree('tests/test1_not_equal.py'))
+    assert cache.misses == 2
+    assert cache.hit_rate == 4 / 6
+    assert cache.cache_info().hits == 4
+
+    # a file changed just now is checked against its content
+    path = str(tmp_path / 'b.py')
+    with open(path, 'wb') as f:
+        f.write(content)
+    FTree(path, cache=cache)
+    with open(path, 'wb') as f:
+        f.write(content.replace(b'x', b'y'))
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns))
+    assert FTree(path, cache=cache).get_node_by_line(5).value == 'y = 0\n'
+
+
+def test_parse_cache_eviction(tmp_path):
+    with open('tests/test.py', 'rb') as f:
+        content = f.read()
+    cache = ParseCache(str(tmp_path / 'cache'))
+    FTree(old_copy(tmp_path, 'a.py', content), cache=cache)
+    entry_size = cache.cache_info().currsize
+
+    cache = ParseCache(str(tmp_path / 'cache'), maxsize=2 * entry_size)
+    paths = [old_copy(tmp_path, f'{name}.py', content) for name in 'bc']
+    for path in paths:
+        FTree(path, cache=cache)
+    assert cache.cache_info().currsize <= 2 * entry_size
+    assert len(os.listdir(str(tmp_path / 'cache'))) == 2
+    FTree(paths[0], cache=cache)
+    FTree(paths[1], cache=cache)
+    assert (cache.hits, cache.misses) == (2, 2)
+
+    cache.clear()
+    assert cache.cache_info().currsize == 0
+    FTree(paths[0], cache=cache)
+    assert cache.misses == 3
+
+
+def test_tree_cache_append(tmp_path):
+    snippet = old_copy(tmp_path, 'snippet.py', b'if y:\n    y = 1\n')
+    cache = TreeCache(maxsize=2)
+    file1 = FTree('tests/test.py', cache=cache)
+    for _ in range(3):
+        file1.append(snippet)
+    assert (cache.hits, cache.misses) == (2, 2)
+    expected = FTree('tests/test.py')
+    for _ in range(3):
+        expected.append(snippet)
+    assert file1 == expected
+    assert file1.to_string() == expected.to_string()
+
+    old_copy(tmp_path, 'snippet.py', b'z = 2\n')
+    file1.append(snippet)
+    assert file1.to_string().endswith('y = 1\nz = 2\n')
+    assert cache.misses == 3
+
+    for name in 'ab':
+        file1.append(old_copy(tmp_path, f'{name}.py', b'pass\n'))
+    assert cache.cache_info().currsize == 2
+    file1.append(snippet)
+    assert cache.misses == 6
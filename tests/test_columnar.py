@@ -0,0 +1,51 @@
+from pyfiletree.columnar import ColumnarFTree
+from pyfiletree.ftree import FTree, Level, Types
+
+
+def test_columnar_read():
+    for path in ('tests/test.py', 'tests/pre_transform.py', 'tests/file_to_append.py', 'tests/test1_not_equal.py'):
+        assert ColumnarFTree(path) == FTree(path)
+    assert ColumnarFTree('tests/test.py') == ColumnarFTree('tests/test2.py')
+    assert ColumnarFTree('tests/test.py') != ColumnarFTree('tests/test1_not_equal.py')
+
+
+def test_columnar_nodes():
+    file1 = ColumnarFTree('tests/test.py')
+    assert file1.root.level == Level.ROOT
+    assert file1.get_node_by_line(0) == file1.root
+
+    def_node = file1.get_node_by_line(4)
+    assert def_node.value == 'def func1():\n'
+    assert def_node.type == Types.FUNCTION
+    assert def_node.father == file1.root
+    assert def_node.size == 10
+    assert [child.line for child in def_node.children] == [5, 6, 12, 13, 14]
+    assert file1.get_node_by_line(9).father.father == def_node.children[1]
+
+    try:
+        _ = file1.get_node_by_line(29)
+    except Exception:
+        assert 1 == 1
+    else:
+        assert 1 != 1
+
+
+def test_columnar_transformer(tmp_path):
+    def self_to_transformer(string):
+        return string.replace("self.", "Transform.")
+    func_list = [
+        lambda x: x.replace("extract", "transform"),
+        self_to_transformer,
+        lambda x: x.replace("self, ", ""),
+        lambda x: x.replace("bala", "ALA"),
+        lambda x: None if "2023" in x else x,
+        lambda x: (None, False) if "print" in x else x,
+    ]
+    pre_transform = ColumnarFTree('tests/pre_transform.py', transformer=list(func_list))
+    expected = FTree('tests/pre_transform.py', transformer=list(func_list))
+    pre_transform.write_to(str(tmp_path / 'columnar.py'), mode='w', apply_transformer=True)
+    expected.write_to(str(tmp_path / 'ftree.py'), mode='w', apply_transformer=True)
+
+    assert (tmp_path / 'columnar.py').read_text() == (tmp_path / 'ftree.py').read_text()
+    assert pre_transform.get_node_by_line(8).value == 'return y\n'
+    assert pre_transform.get_node_by_line(8).level == 3
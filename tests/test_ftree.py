@@ -1,4 +1,11 @@
-from pyfiletree.ftree import FTree, Node
+import io
+import sys
+import tempfile
+
+import pytest
+
+from pyfiletree import ftree
+from pyfiletree.ftree import FTree, MappedNode, Node, SharedNode, Types
 
 
 def test_ftree_read():
@@ -173,3 +180,507 @@ def test_append_node():
 # TODO specify node type on which to apply; pass json/dict
 def test_ftree_transf_node_type():
     pass
+
+
+def test_build_deeply_nested(tmp_path):
+    path = tmp_path / 'nested.py'
+    depth = 3 * sys.getrecursionlimit()
+    path.write_text(''.join(f'{lvl * 4 * " "}if x{lvl}:\n' for lvl in range(depth)))
+    file1 = FTree(str(path))
+    node = file1.root
+    for lvl in range(depth):
+        assert len(node.children) == 1
+        node = node.children[0]
+        assert node.level == lvl
+        assert node.line == lvl + 1
+
+    # traversals don't recurse either
+    assert [node.line for node in file1.iter_nodes()] == list(range(1, depth + 1))
+    assert sum(1 for _ in file1.root.children[0].iter_subtree()) == depth
+    file1.write_to(str(tmp_path / 'nested_out.py'), mode='w')
+    assert (tmp_path / 'nested_out.py').read_text() == path.read_text()
+    file1.root.children[0].update_level(0)
+    assert node.level == depth
+
+
+def test_build_matches_recursive_builder():
+    for path in ('tests/test.py', 'tests/pre_transform.py', 'tests/file_to_append.py', 'tests/test1_not_equal.py'):
+        file1 = FTree(path)
+        file2 = FTree(path)
+        file2.root.children = []
+        with open(path, 'r') as f:
+            file2._build_direct_children(file2.root, f.readlines())
+        assert file1 == file2
+        assert [(n.line, n.level, n.father.line) for n in file1.iter_nodes()] == \
+               [(n.line, n.level, n.father.line) for n in file2.iter_nodes()]
+
+
+def test_node_size():
+    def real_size(node):
+        return sum(1 + real_size(child) for child in node.children)
+
+    file1 = FTree('tests/test.py')
+    assert file1.root.size == real_size(file1.root) == 28
+    assert file1.root.children[3].size == 10
+
+    file1.append('tests/file_to_append.py', line=5)
+    file1.append('tests/file_to_append.py')
+    file1.root.children[3].add_child(Node('child', level=1))
+    file1.get_node_by_line(6).delete(keep_children=False)
+    file1.get_node_by_line(4).delete()
+    file1._get_node_list()
+    for node in [file1.root] + file1.list_nodes:
+        assert node.size == real_size(node)
+    assert Node.get_real_length(file1.root.children) == file1.root.size
+
+
+def test_computed_lines():
+    stored = FTree('tests/test.py')
+    computed = FTree('tests/test.py', computed_lines=True)
+    for file1 in (stored, computed):
+        file1.append('tests/file_to_append.py', line=6)
+        file1.append(FTree('tests/file_to_append.py', computed_lines=True), line=30)
+        file1.append('tests/append_with_transformer.py')
+        file1.set_transformer([lambda x: None if 'child2' in x else x])
+        file1.apply_transformer()
+        file1._get_node_list()
+
+    assert computed.root._line == 0
+    assert all(node._line is None for node in computed.list_nodes)
+    assert [node.line for node in computed.list_nodes] == list(range(1, len(computed.list_nodes) + 1))
+    assert [node.line for node in stored.list_nodes] == [node.line for node in computed.list_nodes]
+    for node in computed.list_nodes:
+        assert computed.get_node_by_line(node.line) is node
+
+    def_node = computed.root.children[3]
+    def_node.children[0].add_child(Node('child', level=3))
+    assert def_node.children[1].line == def_node.line + 3
+
+
+def test_get_node_by_line_index():
+    file1 = FTree('tests/test.py')
+    file1._get_node_list()
+    for node in file1.list_nodes:
+        assert file1.get_node_by_line(node.line) is node
+
+    # changes made directly on the nodes are picked up too
+    def_node = file1.get_node_by_line(4)
+    def_node.delete(keep_children=False)
+    file1._update_lines_globally(4, -11)
+    assert file1.get_node_by_line(4).value == 'y = 0\n'
+    file1.root.children[0].update_line(100)
+    assert file1.get_node_by_line(101) is file1.root.children[0]
+    assert file1.get_node_by_line(2).value == ''
+    try:
+        _ = file1.get_node_by_line(1)
+    except Exception:
+        assert 1 == 1
+    else:
+        assert 1 != 1
+
+
+def test_node_slots():
+    file1 = FTree('tests/test.py', test=True)
+    node = file1.get_node_by_line(4)
+    assert not hasattr(node, '__dict__')
+    assert node.type == Types.FUNCTION
+    node.value = 'class HI:\n'
+    assert node.type == Types.CLASS
+    assert node.__str__() == 'class HI:\n'
+    file1.TEST = False
+    assert node.children[0].__str__() == '    x = 0\n'
+    assert Node('    x = 0\n').__str__() == '    x = 0\n'
+
+
+def test_memory_map(tmp_path):
+    file1 = FTree('tests/pre_transform.py', memory_map=True)
+    file2 = FTree('tests/pre_transform.py')
+    assert file1 == file2
+    file1._get_node_list()
+    assert all(isinstance(node, MappedNode) and node.get_raw_value() is not None for node in file1.list_nodes)
+
+    func_list = [lambda x: x.replace("extract", "transform")]
+    for file in (file1, file2):
+        file.set_transformer(list(func_list))
+        file.write_to(str(tmp_path / f'{id(file)}.py'), mode='w', apply_transformer=True)
+    assert (tmp_path / f'{id(file1)}.py').read_bytes() == (tmp_path / f'{id(file2)}.py').read_bytes()
+
+    # only the changed values were decoded and stored
+    assert file1.get_node_by_line(4).get_raw_value() is None
+    assert file1.get_node_by_line(4).value == 'def transform_from_a():\n'
+    assert file1.get_node_by_line(5).get_raw_value() == b'x = 0\n'
+
+    # empty lines keep the line ending of the file
+    file1 = FTree.from_string(b'class A:\r\n    x = 1\r\n\r\n    def f():\r\n', memory_map=True)
+    assert file1.to_string() == 'class A:\r\n    x = 1\r\n    \r\n    def f():\r\n'
+
+
+def test_lazy(tmp_path):
+    file1 = FTree('tests/test.py', lazy=True)
+    assert [child.value for child in file1.root.children] == \
+           [child.value for child in FTree('tests/test.py').root.children]
+    assert all(node.get_raw_body() is not None for node in file1.root.children if node.size)
+    assert file1.root.size == 28
+
+    # only the block holding the line is parsed
+    assert file1.get_node_by_line(9).value == 'y = 2023\n'
+    def_node = file1.root.children[3]
+    assert def_node.get_raw_body() is None
+    assert file1.root.children[-1].get_raw_body() is not None
+
+    # untouched blocks are rendered as the parsed ones without being parsed
+    def_node.children[0].value = 'x = 1\n'
+    file1.write_to(str(tmp_path / 'lazy.py'), mode='w')
+    expected = FTree('tests/test.py').to_string().replace('    x = 0\n', '    x = 1\n')
+    assert (tmp_path / 'lazy.py').read_text() == expected
+    assert file1.root.children[-1].get_raw_body() is not None
+
+    file1 = FTree.from_string('class A:\n     x = 1\n    \ty\n', lazy=True)
+    assert file1.to_string() == 'class A:\n    x = 1\n    y\n'
+    assert file1.root.children[0].get_raw_body() is not None
+
+    assert FTree('tests/test.py', lazy=True) == FTree('tests/test.py')
+
+
+def test_parallel_parse(tmp_path):
+    file1 = FTree('tests/test.py', workers=3)
+    file2 = FTree('tests/test.py')
+    assert file1 == file2
+    file1._get_node_list()
+    file2._get_node_list()
+    assert [(node.line, node.level, node.size, node.father.line) for node in file1.list_nodes] == \
+           [(node.line, node.level, node.size, node.father.line) for node in file2.list_nodes]
+
+    # a chunk starting on a line indented with whitespace unknown to the split is parsed again serially
+    path = tmp_path / 'split.py'
+    path.write_text('def f():\n    x = 0\n' * 3 + '\x1c\x1c\x1c\x1cy = 1\n' + 'def g():\n    x = 0\n' * 2)
+    file1 = FTree(str(path), workers=2)
+    file2 = FTree(str(path))
+    assert file1 == file2
+    assert file1.get_node_by_line(7).level == 1
+    assert file1.get_node_by_line(7).father.line == 5
+
+
+def test_scan_lines():
+    pytest.importorskip('numpy')
+    with open('tests/test.py', 'rb') as f:
+        buffer = f.read()
+    buffer += b'  \r\n\tx = 1\r\n\x0c\n    \n        last'
+    for start, end in ((0, len(buffer)), (10, len(buffer) - 3), (len(buffer) - 12, len(buffer))):
+        assert ftree.scan_lines_numpy(buffer, start, end) == ftree.scan_lines(buffer, start, end)
+
+    # big files are scanned with numpy, the tree is the same
+    def get_lines(file):
+        file._get_node_list()
+        return [(node.value, node.level, node.line, node.father.line) for node in file.list_nodes]
+
+    expected = get_lines(FTree('tests/test.py', memory_map=True))
+    min_bytes = ftree.NUMPY_MIN_BYTES
+    ftree.NUMPY_MIN_BYTES = 0
+    try:
+        assert get_lines(FTree('tests/test.py', memory_map=True)) == expected
+    finally:
+        ftree.NUMPY_MIN_BYTES = min_bytes
+
+
+def test_apply_transformer_deletes():
+    transformer = [lambda x: (None, False) if x.startswith('if') else x,
+                   lambda x: None if x.startswith('def') else x]
+    file1 = FTree('tests/test.py', transformer=list(transformer))
+    file2 = FTree('tests/test.py', transformer=list(transformer), computed_lines=True)
+    for file in (file1, file2):
+        file.apply_transformer()
+        file._get_node_list()
+        # lines are the positions in the tree, children of deleted functions moved up a level
+        assert [node.line for node in file.list_nodes] == list(range(1, len(file.list_nodes) + 1))
+        assert file.root.size == len(file.list_nodes)
+        assert not any(node.value.startswith(('if', 'def')) for node in file.list_nodes)
+    assert [(node.value, node.level) for node in file1.list_nodes] == \
+           [(node.value, node.level) for node in file2.list_nodes]
+    assert file1.get_node_by_line(4).value == 'x = 0\n'
+    assert file1.get_node_by_line(4).level == 0
+
+
+def test_apply_transformer_scope():
+    transformer = [lambda x: x.upper()]
+    file1 = FTree('tests/test.py', transformer=list(transformer))
+    file1.apply_transformer(lines=range(5, 7))
+    assert [file1.get_node_by_line(line).value for line in (4, 5, 6, 7)] == \
+           ['def func1():\n', 'X = 0\n', 'IF X == 0:\n', 'print("hehe")\n']
+
+    file1.apply_transformer(types={Types.CLASS, Types.FUNCTION})
+    assert file1.get_node_by_line(4).value == 'DEF FUNC1():\n'
+    assert file1.get_node_by_line(24).value == 'CLASS HI:\n'
+    assert file1.get_node_by_line(7).value == 'print("hehe")\n'
+
+    file1 = FTree('tests/test.py', transformer=list(transformer))
+    file1.apply_transformer(node=file1.get_node_by_line(27), types={Types.STATEMENT})
+    assert file1.get_node_by_line(27).value == 'def __str__(self):\n'
+    assert file1.get_node_by_line(28).value == "RETURN 'DE CE NU?'\n"
+
+    file1 = FTree('tests/test.py', transformer=[lambda x: 'X' + x])
+    file1.apply_transformer(lines=range(1, 10, 4))
+    file1.apply_transformer(lines=[4, 1])
+    file1.apply_transformer(types=[Types.CLASS, Types.CLASS])
+    assert [file1.get_node_by_line(line).value for line in (1, 4, 5, 9)] == \
+           ['XXimport library\n', 'Xdef func1():\n', 'Xx = 0\n', 'Xy = 2023\n']
+    assert file1.get_node_by_line(24).value == 'Xclass HI:\n'
+
+    # values changed directly on the nodes are picked up by the kept index of the types
+    file1.get_node_by_line(5).value = 'class X:\n'
+    file1.apply_transformer(types={Types.CLASS})
+    assert file1.get_node_by_line(5).value == 'Xclass X:\n'
+    assert file1.get_node_by_line(24).value == 'XXclass HI:\n'
+
+    # the root holds the file path, it's never transformed
+    file1 = FTree('tests/test.py', transformer=[lambda x: None if x == 'tests/test.py' else x.upper()])
+    file1.apply_transformer(node=file1.root)
+    assert file1.root.value == 'tests/test.py'
+    assert file1.get_node_by_line(1).value == 'IMPORT LIBRARY\n'
+
+    # deletions in the scope move children up the same way as the whole tree
+    for computed_lines in (False, True):
+        file1 = FTree('tests/test.py', transformer=[lambda x: None if x.startswith('if') else x],
+                      computed_lines=computed_lines)
+        file1.apply_transformer(node=file1.get_node_by_line(4))
+        file2 = FTree('tests/test.py', transformer=[lambda x: None if x.startswith(('if x', 'if y')) else x])
+        file2.apply_transformer()
+        file1._get_node_list()
+        file2._get_node_list()
+        assert [(node.value, node.level, node.line) for node in file1.list_nodes] == \
+               [(node.value, node.level, node.line) for node in file2.list_nodes]
+        assert file1.root.size == 25
+
+
+def test_write_to_leaves_tree_unchanged(tmp_path):
+    file1 = FTree('tests/test.py')
+    file1.write_to(str(tmp_path / 'out.py'), mode='w')
+    assert file1.get_node_by_line(2).value == ''
+    assert file1.get_node_by_line(2).type == Types.EMPTY_LINE
+    assert (tmp_path / 'out.py').read_text().splitlines(True)[:4] == ['import library\n', '\n', '\n', 'def func1():\n']
+    assert (tmp_path / 'out.py').read_text().count('\n') == 28
+
+    file1.DEBUG = True
+    file1.write_to(str(tmp_path / 'debug.py'), mode='w')
+    assert (tmp_path / 'debug.py').read_text().splitlines()[1] == ' --> lvl:0 : line2 : father:tests/test.py'
+
+
+def test_write_incremental(tmp_path):
+    for options in ({'memory_map': True}, {'lazy': True}, {}):
+        path = tmp_path / 'source.py'
+        path.write_bytes(open('tests/test.py', 'rb').read())
+        file1 = FTree(str(path), **options)
+        file1.get_node_by_line(4).value = 'def renamed_func():\n'
+        file1.write_to(str(tmp_path / 'expected.py'), mode='w')
+        file1.write_to(str(path), incremental=True)
+        assert path.read_bytes() == (tmp_path / 'expected.py').read_bytes()
+        assert sorted(p.name for p in tmp_path.iterdir()) == ['expected.py', 'source.py']
+        (tmp_path / 'expected.py').unlink()
+
+    # same length: only the changed line is written, in the same file
+    path.write_bytes(b'import library\n\ndef func1():\n    x = 0\n    if x == 0:\n        print(x)\n')
+    file1 = FTree(str(path), memory_map=True)
+    inode = path.stat().st_ino
+    expected = path.read_bytes().replace(b'def func1', b'def FUNC1', 1)
+    node = file1.get_node_by_line(3)
+    node.value = 'def FUNC1():\n'
+    assert node.get_origin(file1._buffer) is None
+    file1.write_to(str(path), incremental=True)
+    assert path.stat().st_ino == inode
+    assert path.read_bytes() == expected
+
+    child = file1.get_node_by_line(4)
+    assert child.get_origin(file1._buffer) is not None
+    child.level += 1
+    assert child.get_origin(file1._buffer) is None
+
+    # empty CRLF lines are unchanged lines and keep their line ending once copied out
+    path.write_bytes(b'x = 1\r\n\r\ny = 2\r\n')
+    file1 = FTree(str(path), memory_map=True)
+    assert all(node.get_origin(file1._buffer) is not None for node in file1.iter_nodes())
+    file1.get_node_by_line(1).value = 'x = 9\r\n'
+    for _ in range(2):
+        file1.write_to(str(path), incremental=True)
+        assert path.read_bytes() == b'x = 9\r\n\r\ny = 2\r\n'
+        assert file1.to_string() == 'x = 9\r\n\r\ny = 2\r\n'
+
+
+def test_write_to_mapped_source(tmp_path):
+    # the mapped file is replaced instead of truncated while its values are read
+    path = tmp_path / 'source.py'
+    path.write_bytes(open('tests/test.py', 'rb').read())
+    transformer = [lambda x: x.replace('x', 'z')]
+    expected = FTree(str(path), transformer=list(transformer)).to_string(apply_transformer=True)
+    FTree(str(path), memory_map=True, transformer=list(transformer)).write_to(str(path), mode='w',
+                                                                             apply_transformer=True)
+    assert path.read_text() == expected
+
+    file1 = FTree(str(path), memory_map=True)
+    with open(path, 'r+b') as f:
+        file1.write_to(f)
+    assert path.read_text() == expected
+    file1 = FTree(str(path), memory_map=True)
+    with open(path, 'wb') as f:
+        with pytest.raises(Exception):
+            file1.write_to(f)
+
+    path.write_bytes(b'if x:\r\n    y = 1\r\n\r\n    z = 2\r\n')
+    file1 = FTree(str(path), memory_map=True)
+    expected = file1.to_string()
+    with open(path, 'r+b') as f:
+        file1.write_to(f)
+    assert file1.to_string() == path.read_bytes().decode() == expected
+
+
+def test_render_in_memory(tmp_path):
+    for options in ({}, {'memory_map': True}, {'lazy': True}, {'test': True}):
+        file1 = FTree('tests/test.py', **options)
+        parsed = [node.is_parsed() for node in file1.root.children] if options.get('lazy') else None
+        file1.write_to(str(tmp_path / 'out.py'), mode='w')
+        expected = (tmp_path / 'out.py').read_text()
+        (tmp_path / 'out.py').unlink()
+
+        assert file1.to_string() == expected
+        assert list(file1.iter_lines()) == expected.splitlines(True)
+        text, binary = io.StringIO(), io.BytesIO()
+        file1.write_to(text)
+        file1.write_to(binary)
+        assert text.getvalue() == expected
+        assert binary.getvalue() == expected.encode()
+        if options.get('lazy'):
+            assert [node.is_parsed() for node in file1.root.children] == parsed
+
+    file1 = FTree('tests/test.py', transformer=[lambda x: x.replace('x', 'z')])
+    assert 'z = 0' in file1.to_string(apply_transformer=True)
+    assert compile(FTree('tests/test.py').to_string(), 'test.py', 'exec')
+
+
+def test_from_memory():
+    def nodes(tree):
+        return [(node.value, node.level, node.line) for node in tree.iter_nodes()]
+
+    with open('tests/test.py') as f:
+        text = f.read()
+    for options in ({}, {'memory_map': True}, {'lazy': True}, {'computed_lines': True}):
+        assert FTree.from_string(text, **options).to_string() == FTree('tests/test.py', **options).to_string()
+        expected = nodes(FTree('tests/test.py', **options))
+        assert nodes(FTree.from_string(text, **options)) == expected
+        assert nodes(FTree.from_string(text.encode(), **options)) == expected
+        assert nodes(FTree.from_lines(text.splitlines(), **options)) == expected
+        assert nodes(FTree.from_lines(text.encode().splitlines(keepends=True), **options)) == expected
+        with open('tests/test.py', 'rb') as f:
+            assert nodes(FTree.from_stream(f, **options)) == expected
+            assert not f.closed
+        assert nodes(FTree.from_stream(io.StringIO(text), **options)) == expected
+    with tempfile.TemporaryFile() as f:
+        f.write(text.encode())
+        f.seek(0)
+        assert FTree.from_stream(f).root.value == '<stream>'
+    assert FTree.from_lines([b'x = 1', b'y = 2\n']).to_string() == 'x = 1\ny = 2\n'
+    assert FTree.from_string('').to_string() == ''
+    assert FTree.from_string('', memory_map=True).to_string() == ''
+    assert FTree.from_string('x = 1\r\n').to_string() == 'x = 1\n'
+
+    file1 = FTree('tests/test.py')
+    file1.append(FTree.from_string('if y:\n    y = 1\n'), line=5)
+    assert file1.get_node_by_line(5).value == 'if y:\n'
+    assert file1.get_node_by_line(6).value == 'y = 1\n'
+    assert file1.get_node_by_line(6).level == 2
+
+
+def test_clone():
+    for options in ({}, {'computed_lines': True}, {'memory_map': True}, {'lazy': True}):
+        file1 = FTree('tests/test.py', transformer=[str.upper], **options)
+        file2 = file1.clone()
+        assert file2.to_string() == file1.to_string()
+        assert file2 == file1
+        assert [node.line for node in file2.iter_nodes()] == [node.line for node in file1.iter_nodes()]
+        file2.set_transformer([str.lower])
+        file2.apply_transformer()
+        assert len(file1.transformer) == 1
+        assert file1.get_node_by_line(4).value == 'def func1():\n'
+
+    node = FTree('tests/test.py').get_node_by_line(6)
+    copy = node.clone()
+    assert copy.father is None and copy == node and copy.children[0] is not node.children[0]
+    assert copy.size == node.size and copy.children[0].father is copy
+
+
+def test_append_copy(tmp_path):
+    snippet = FTree.from_string('if y:\n    y = 1\n')
+    file1 = FTree('tests/test.py')
+    file2 = FTree('tests/test.py')
+    for line in (5, 5, -1):
+        file1.append(snippet, line=line, copy=True)
+        file2.append(FTree.from_string('if y:\n    y = 1\n'), line=line)
+    assert file1.to_string() == file2.to_string()
+    assert snippet.to_string() == 'if y:\n    y = 1\n'
+
+    node = FTree('tests/test.py').get_node_by_line(6)
+    file1.append(node, line=1)
+    assert file1.get_node_by_line(1).value == 'if x == 0:\n'
+    assert file1.get_node_by_line(1).level == 0
+    assert file1.get_node_by_line(2).level == 1
+    assert node.level == 1 and node.father is not None
+
+    # appended lines no longer read the memory mapped file, which can be patched in place
+    path = tmp_path / 'source.py'
+    path.write_bytes(b'x = 1\ny = 2\n')
+    file1 = FTree.from_string('')
+    file2 = FTree(str(path), memory_map=True)
+    file1.append(file2.get_node_by_line(1))
+    file2.get_node_by_line(1).value = 'x = 9\n'
+    file2.write_to(str(path), incremental=True)
+    assert file1.to_string() == 'x = 1\n'
+    file1.append(FTree(str(path), memory_map=True))
+    file1.write_to(str(path), mode='w')
+    assert path.read_text() == 'x = 1\nx = 9\ny = 2\n'
+
+    # with their line endings
+    path.write_bytes(b'if x:\r\n    y = 1\r\n\r\n    z = 2\r\n')
+    file1 = FTree.from_string(b'a = 0\r\n', memory_map=True)
+    file1.append(FTree(str(path), memory_map=True).get_node_by_line(1))
+    file1.append(FTree(str(path), memory_map=True))
+    assert file1.to_string() == 'a = 0\r\n' + 2 * 'if x:\r\n    y = 1\r\n    \r\n    z = 2\r\n'
+
+
+def test_share():
+    file1 = FTree('tests/test.py')
+    expected = file1.to_string()
+    old_node = file1.get_node_by_line(4)
+    file2 = file1.clone(share=True)
+    assert old_node.father is None and file1.get_node_by_line(4) is not old_node
+    with pytest.raises(Exception):
+        old_node.delete()
+    file1.transformer = [str.upper]
+    with pytest.raises(Exception):
+        file1.apply_transformer(node=old_node)
+    file1.transformer = None
+    assert file1.computed_lines and file2.computed_lines
+    assert file2.to_string() == expected
+    assert all(isinstance(node, SharedNode) for tree in (file1, file2) for node in tree.root.children)
+
+    file2.get_node_by_line(7).value = 'print("changed")\n'
+    assert file1.to_string() == expected
+    assert file2.to_string() == expected.replace('print("hehe")', 'print("changed")')
+    assert file2.get_node_by_line(27).is_shared()  # lines away from the change are still shared
+    assert file1.get_node_by_line(6).is_shared()
+
+    file1.set_transformer([lambda x: x])
+    file1.apply_transformer()
+    assert file1.get_node_by_line(6).is_shared()
+    file1.transformer = [lambda x: x.replace('2023', '2024'), lambda x: None if x.startswith('print') else x]
+    file1.apply_transformer()
+    assert '2024' in file1.to_string() and 'print' not in file1.to_string()
+    assert file2.to_string() == expected.replace('print("hehe")', 'print("changed")')
+    assert file1.get_node_by_line(4).children[0].value == 'x = 0\n'
+
+    snippet = FTree.from_string('if y:\n    y = 1\n')
+    file3 = FTree('tests/test.py')
+    file4 = FTree('tests/test.py', computed_lines=True)
+    for line in (5, 5, -1):
+        file3.append(snippet, line=line, share=True)
+        file4.append(FTree.from_string('if y:\n    y = 1\n'), line=line)
+    assert file3.to_string() == file4.to_string()
+    assert [node.line for node in file3.iter_nodes()] == [node.line for node in file4.iter_nodes()]
+    assert snippet.to_string() == 'if y:\n    y = 1\n'
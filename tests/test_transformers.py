@@ -0,0 +1,154 @@
+import re
+
+from pyfiletree.columnar import ColumnarFTree
+from pyfiletree.ftree import FTree, run_transformer
+from pyfiletree.transformers import Memoized, Pipeline, Replacer, pure
+
+
+def rename(value):
+    return value.replace('x', 'z')
+
+
+def drop_ifs(value):
+    return (None, False) if value.startswith('if') else value
+
+
+def test_pipeline_run():
+    functions = [
+        lambda x: x.replace('x', 'z'),
+        lambda x: (None, False) if x.startswith('if') else x,
+        lambda x: ('kept', True),  # tuples not deleting the line leave it as is
+        lambda x: None if x.startswith('return') else x,
+        lambda x: x.upper(),
+    ]
+    pipeline = Pipeline(functions)
+    for value in ('x = 0\n', 'if x == 0:\n', 'return x\n', '\n', ''):
+        assert pipeline.run(value) == run_transformer(functions, value)
+    assert pipeline('if x == 0:\n') == (None, False)
+    assert pipeline('return x\n') == (None, True)
+    assert pipeline('x = 0\n') == 'Z = 0\n'
+
+    # pure functions are called without checking their result
+    pipeline = Pipeline([pure(str.lower), lambda x: None if 'print' in x else x, pure(str.strip)])
+    assert pipeline.run('  PRINT(x)\n') == (None, True)
+    assert pipeline.run('X = 1\n') == ('x = 1', None)
+    assert [func('A') for func in pipeline] == ['a', 'A', 'A']
+    pipeline.extend([pure(lambda x: x + '!')])
+    assert len(pipeline) == 4
+    assert pipeline.run('X = 1\n') == ('x = 1!', None)
+
+
+def test_pipeline_transformer(tmp_path):
+    functions = [lambda x: x.replace("extract", "transform"), lambda x: (None, True) if 'def' in x else x]
+    file1 = FTree('tests/pre_transform.py', transformer=Pipeline(functions))
+    file2 = FTree('tests/pre_transform.py', transformer=list(functions))
+    file3 = ColumnarFTree('tests/pre_transform.py', transformer=Pipeline(functions))
+    for file in (file1, file2, file3):
+        file.write_to(str(tmp_path / f'{id(file)}.py'), mode='w', apply_transformer=True)
+    assert (tmp_path / f'{id(file1)}.py').read_text() == (tmp_path / f'{id(file2)}.py').read_text()
+    assert (tmp_path / f'{id(file1)}.py').read_text() == (tmp_path / f'{id(file3)}.py').read_text()
+
+    # a pipeline set on a tree with a list transformer keeps the tree compiled
+    file1 = FTree('tests/test.py', transformer=[lambda x: x.replace('x', 'y')])
+    file1.set_transformer(Pipeline([pure(str.upper)]))
+    assert isinstance(file1.transformer, Pipeline)
+    file1.apply_transformer()
+    assert file1.get_node_by_line(5).value == 'Y = 0\n'
+
+    file1 = FTree('tests/test.py')
+    file1.append('tests/file_to_append.py', transformer=Pipeline([pure(str.upper)]))
+    assert file1.get_node_by_line(29).value == FTree('tests/file_to_append.py').get_node_by_line(1).value.upper()
+
+
+def test_replacer():
+    replacer = Replacer({'x': 'y', 'x == 0': 'True', 'print': 'log'})
+    assert replacer('if x == 0: print(x)\n') == 'if True: log(y)\n'
+    value = 'return z\n'
+    assert replacer(value) is value
+    assert Replacer({})(value) is value
+
+    replacer = Replacer([(r'(\w+)\(', r'call_\1('), (r'\d+', lambda match: str(int(match.group()) * 2))], regex=True)
+    assert replacer('foo(12, bar(3))\n') == 'call_foo(24, call_bar(6))\n'
+    assert Replacer({}, regex=True)(value) is value
+
+    # flags only apply to their own pattern
+    replacer = Replacer([('(?i)self', 'cls'), (re.compile('none', re.IGNORECASE), 'None'), ('true', 'True')],
+                        regex=True)
+    assert replacer('SELF.x = NONE or TRUE or true\n') == 'cls.x = None or TRUE or True\n'
+
+    # plugs into transformer lists and pipelines, where it is pure
+    file1 = FTree('tests/test.py', transformer=[Replacer({'x': 'z', 'y': 'x'})])
+    file2 = FTree('tests/test.py', transformer=Pipeline([Replacer({'x': 'z', 'y': 'x'})]))
+    for file in (file1, file2):
+        file.apply_transformer()
+    assert file1 == file2
+    assert file1.get_node_by_line(9).value == 'x = 2023\n'
+    assert file1.get_node_by_line(5).value == 'z = 0\n'
+
+
+def test_apply_transformer_workers():
+    for transformer in ([rename, drop_ifs], Pipeline([Replacer({'y': 'w'}), drop_ifs, pure(str.upper)]),
+                        [rename, lambda x: x.upper()]):
+        file1 = FTree('tests/test.py', transformer=transformer)
+        file2 = FTree('tests/test.py', transformer=transformer)
+        file1.apply_transformer(workers=2)
+        file2.apply_transformer()
+        file1._get_node_list()
+        file2._get_node_list()
+        assert [(node.value, node.level, node.line) for node in file1.list_nodes] == \
+               [(node.value, node.level, node.line) for node in file2.list_nodes]
+
+    # unchanged values are kept as they are
+    file1 = FTree('tests/test.py', transformer=[rename], memory_map=True)
+    file1.apply_transformer(workers=2)
+    assert file1.get_node_by_line(1).get_raw_value() == b'import library\n'
+    assert file1.get_node_by_line(5).value == 'z = 0\n'
+
+
+def test_memoized():
+    calls = []
+
+    def count(value):
+        calls.append(value)
+        return value
+
+    transformer = Memoized([count, rename], maxsize=4)
+    file1 = FTree('tests/test.py', transformer=transformer)
+    file1.apply_transformer()
+    file1._get_node_list()
+    values = [node.value for node in file1.list_nodes]
+    assert transformer.hits + transformer.misses == len(values) == 28
+    assert transformer.misses == len(calls) < len(values)
+    assert transformer.cache_info().currsize == 4
+    assert file1.get_node_by_line(5).value == 'z = 0\n'
+
+    file2 = FTree('tests/test.py', transformer=[rename])
+    file2.apply_transformer()
+    assert file1 == file2
+
+    transformer.extend([pure(str.upper)])
+    assert transformer.hits == transformer.misses == 0
+
+    # repeated lines which don't change are given back as they are, so they stay shared and mapped
+    text = 'class A:\n    pass\n' * 50
+    file1 = FTree.from_string(text)
+    file2 = file1.clone(share=True)
+    file2.set_transformer(Memoized([lambda x: x]))
+    file2.apply_transformer()
+    assert file2.transformer.hits == 98
+    assert all(node.is_shared() for node in file2.root.children)
+    file1 = FTree.from_string(text, memory_map=True, transformer=Memoized([lambda x: x]))
+    file1.apply_transformer()
+    assert all(node.get_raw_value() is not None for node in file1.iter_nodes())
+
+    # set on a tree with a transformer, the lines are still cached
+    file1 = FTree.from_string('pass\n' * 100, transformer=[rename])
+    file1.set_transformer(Memoized([str.upper]))
+    assert isinstance(file1.transformer, Memoized) and len(file1.transformer) == 2
+    file1.apply_transformer()
+    assert file1.transformer.misses == 1 and file1.transformer.hits == 99
+    assert file1.get_node_by_line(1).value == 'PASS\n'
+    assert transformer('x = 0\n') == transformer('x = 0\n') == 'Z = 0\n'
+    assert transformer.hits == 1
+    transformer.cache_clear()
+    assert transformer.cache_info().currsize == 0